@@ -1,6 +1,6 @@
 __author__ = 'folke'
 
-from pyb import UART, delay, micros, elapsed_micros, Pin
+from pyb import UART, delay, micros, elapsed_micros, millis, elapsed_millis, Pin
 import binascii
 
 
@@ -13,9 +13,22 @@ class HA7S:
 		DS2423 Counter (2 channels 32 bits counters)
 	"""
 
-	def __init__(self, uart_port):
+	LCD_ROW_ADR = (0x00, 0x40, 0x14, 0x54)  # LCD memory adr for start of row [0–3] (4 rows x 20 chars LCD ONLY)
+	HEX = b'0123456789ABCDEFabcdef'  # Valid chars in a respons (before '\r')
+
+	def __init__(self, uart_port, dbg=None, timeout_ms=250, retries=3):
 		self.ROW_LENGTH = 20  # LCD 4 rows x 20 chars
 		self.uart = UART(uart_port, 9600)
+		self.dbg = dbg  # Optional debug Pin: high while receiving
+		self.timeout_ms = timeout_ms  # Max wait for a complete respons
+		self.retries = retries  # Replays of a failed step (after resync) before giving up
+		self.stats = {}  # rom: [steps, bad frames, failed steps]
+
+		''' Cell (row * ROW_LENGTH + col) to LCD memory adr, and the command setting the LCD adr counter to it '''
+		self.lcd_cell_adr = tuple(a + c for a in self.LCD_ROW_ADR for c in range(self.ROW_LENGTH))
+		self.lcd_cell_cmd = tuple('W0210%02X\r' % (0x80 | a) for a in self.lcd_cell_adr)
+		self.selected = None  # rom last addressed ('A'); 'M' reselects it. None after 'R' or search
+		self.lcd_adr = {}  # rom: LCD adr counter (next cell written), for LCDs where it's known
 
 	def scan_for_devices(self):
 		""" Find all 1-Wire rom_codes on the bus """
@@ -43,49 +56,49 @@ class HA7S:
 		""" Setup and read temp data from DS18b20 """
 
 		# Todo: check negative temps works
-		retries = 3
-		while retries:
-			""" Initiate Temperature Conversion by selecting and sending 0x44-command """
-			resp = self.tx_rx(b'A' + rom + '\r', 17)  # Adressing
-			dummy = self.tx_rx('W0144\r', 3)  # Write block of data '44' Trigg measurement
-			resp1 = self.tx_rx('M\r', 17)  # Reset AND reselect (enl HA7S doc)
-			if resp1 == resp:
-				delay(750)  # Give DS18B20 time to measure
-				# The temperature result is stored in the scratchpad memory
-				data = self.tx_rx(b'W0ABEFFFFFFFFFFFFFFFFFF\r', 21)  # Write to scratchpad and READ result
-				dummy = self.tx_rx('R', 1)  # Reset
-				m = self.hex_byte_to_int(data[4:6])
-				l = self.hex_byte_to_int(data[2:4])
-				t = (m << 8) | (l & 0xff)
-				if m < 8:
-					t *= 0.0625  # Convert to Temp [°C]; Plus
-				else:
-					# temp given as 2's compl 16 bit int
-					t = (t - 65536) * 0.0625  # Convert to Temp [°C]; Minus
-				print("Rom, retur temperatur: ", rom, data, t, '°C')
-				return t
-			else:
-				retries -= 1
-				print("Retries: resp, resp1: ", retries, resp, resp1)
-				if retries < 1:
-					break
+		""" Initiate Temperature Conversion by selecting and sending 0x44-command """
+		if self.step(rom, b'A' + rom + b'\r', 17) is None:  # Adressing
+			return None
+		if self.step(rom, 'W0144\r', 3) is None:  # Write block of data '44' Trigg measurement
+			return None
+		if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect (enl HA7S doc)
+			return None
+		delay(750)  # Give DS18B20 time to measure
+		# The temperature result is stored in the scratchpad memory
+		data = self.step(rom, b'W0ABEFFFFFFFFFFFFFFFFFF\r', 21)  # Write to scratchpad and READ result
+		dummy = self.tx_rx('R', 1)  # Reset
+		if data is None:
+			return None
+		m = self.hex_byte_to_int(data[4:6])
+		l = self.hex_byte_to_int(data[2:4])
+		t = (m << 8) | (l & 0xff)
+		if m < 8:
+			t *= 0.0625  # Convert to Temp [°C]; Plus
+		else:
+			# temp given as 2's compl 16 bit int
+			t = (t - 65536) * 0.0625  # Convert to Temp [°C]; Minus
+		print("Rom, retur temperatur: ", rom, data, t, '°C')
+		return t
 
 	def read_ds2423_counters(self, rom):
 		""" Read counter values for the two counters (A & B) conncted to external pins """
 
-		resp = self.tx_rx(b'A' + rom + '\r', 17)  # Adressing
+		if self.step(rom, b'A' + rom + b'\r', 17) is None:  # Adressing
+			return None
 
 		""" Write/read block: A5 01C0/01E0(CounterA/B) [MSByte sent last] + 'FF'*42 (timeslots during which slave
 		returns	32 bytes scratchpad data + 4(cntA/cntB) + 4(zeroBytes) + 2 CRC bytes """
 
-		# Todo: check if respons = written; repeat otherwise
 		# We set adr so we only read LAST byte of page 14. We also get counter(4 B) + zerobytes(4 B) and CRC(2 B)
-		dataA = self.tx_rx('W0EA5DF01' + 'FF' * 11 + '\r', 29)  # Read mem & Counter + TA1/TA2 (adr = 0x11C0)
-		dummy = self.tx_rx('M\r', 17)  # Reset AND reselect (enl HA7S doc)
+		dataA = self.step(rom, 'W0EA5DF01' + 'FF' * 11 + '\r', 29)  # Read mem & Counter + TA1/TA2 (adr = 0x11C0)
+		if dataA is None or self.step(rom, 'M\r', 17) is None:  # Reset AND reselect (enl HA7S doc)
+			return None
 
 		# We set adr so we only read LAST byte of page 15. We also get counter(4 B) + zerobytes(4 B) and CRC(2 B)
-		dataB = self.tx_rx('W0EA5FF01' + 'FF' * 11 + '\r', 29)  # Read mem & Counter + TA1/TA2 (adr = 0x11C0)
+		dataB = self.step(rom, 'W0EA5FF01' + 'FF' * 11 + '\r', 29)  # Read mem & Counter + TA1/TA2 (adr = 0x11C0)
 		dummy = self.tx_rx('R\r', 1)  # Reset and red data (b'BE66014B467FFF0A102D\r')
+		if dataB is None:
+			return None
 
 		''' Convert 32 bits hexadecimal ascii-string (LSByte first) to integer '''
 		cntA = self.lsb_first_hex_ascii_to_int32(dataA[8:16])
@@ -100,36 +113,33 @@ class HA7S:
 		target_adr [0..0x1FF] as integer
 
 		Not implemented: readback of CRC after end of write. This works ONLY if data
-		written extends to end of page """
-
-		self.tx_rx(b'A' + rom + '\r', 17)  # Adressing
+		written extends to end of page. Returns False if it doesn't fit or the write failed """
 
 		""" Write to scratach: 'OF' [TA1/TA2] (Byte reversed) + data string as hex ascii
 		HA7S can only write 32 bytes in a chunk. """
 
-		# Todo: check if respons = written; repeat otherwise
 		# Check string length AND that it fits on page (check target_adr + s_len)
 		s_len = len(s)
 		if target_adr < 0x200 and s_len <= 32 and (target_adr % 0x20) + s_len <= 32:
 			swap_adr = self.int8_to_2hex_string(target_adr & 0xFF) + self.int8_to_2hex_string(target_adr >> 8)
 			if s_len > 29:
-				''' Send first 16 bytes only, as first part '''
-				resp1 = self.tx_rx('W130F' + swap_adr + self.bin2hex(s[:16]) + '\r', 7 + 32)  # First 16 bytes of data
-				''' Adjust parameters for next write '''
+				''' Send first 16 bytes only, as first part; rest of string as second part (same write command) '''
 				nr_bytes_hex = self.int8_to_2hex_string(s_len - 16)
-				s = s[16:]
-				s_len -= 16
-				# Send rest of string as second part
-				resp2 = self.tx_rx('W' + nr_bytes_hex + self.bin2hex(s) + '\r', 1 + (s_len * 2))  # Only string now
-				resp = resp1[:6] + ':' + resp1[6:-1] + '/' + resp2
+				blocks = (('W130F' + swap_adr + self.bin2hex(s[:16]) + '\r', 7 + 32),  # First 16 bytes of data
+				          ('W' + nr_bytes_hex + self.bin2hex(s[16:]) + '\r', 1 + ((s_len - 16) * 2)))  # Only string now
 			else:
 				nr_bytes_hex = self.int8_to_2hex_string(3 + s_len)
-				resp = self.tx_rx('W' + nr_bytes_hex + '0F' + swap_adr + self.bin2hex(s) + '\r', 7 + (s_len * 2))
+				blocks = (('W' + nr_bytes_hex + '0F' + swap_adr + self.bin2hex(s) + '\r', 7 + (s_len * 2)),)
+			resp = self.step_blocks(rom, blocks)
 			dummy = self.tx_rx('R\r', 1)  # Reset and stop
+			if resp is None:
+				return False
 
 			print("write_ds2423_scratchpad: Reponse", resp)
+			return True
 		else:
 			print("write_ds2423_scratchpad: String will not fit!; Target_adr or length of string to big!")
+			return False
 
 	def read_and_copy_ds2423_scratchpad(self, rom):
 		""" Read Scratchpad and copy to SRAM
@@ -138,23 +148,40 @@ class HA7S:
 		the offset inside scratchpad is set to 5 lsbits of TA1, and data is fetched from there until 'Ending offset'.
 		'Ending offset' is the offset for the last chr written to scratchpad
 
-		Finally a copy of (updated part of) scratchpad is written to SRAM """
-
-		# Todo: check if respons = written; repeat otherwise
-		self.tx_rx(b'A' + rom + '\r', 17)  # Adressing
-
-		auth = self.tx_rx('W04AA' + ('FF' * 3) + '\r', 9)  # Read 'AA' + TA1/TA2 + Status(E/S)
-		target_adr = (self.hex_byte_to_int(auth[4:6]) << 8) + self.hex_byte_to_int(auth[2:4])  # MSB and LSB Swapped
-		status = self.hex_byte_to_int(auth[6:8])
-		print(" read_and_copy_ds2423_scratchpad: auth, targetAdress, Status(E/S) 'Ending offset': ",
-		      auth, hex(target_adr), hex(status & 0x1F))
-
-		''' Continue reading timeslots until end of written part of scratchpad '''
-		nr_bytes = (status & 0x1F) - (target_adr & 0x1F) + 1  # 1+Ending offset-Start offset = # bytes written/to read
-		nr_bytes_hex = self.int8_to_2hex_string(nr_bytes)
-		data = self.tx_rx('W' + nr_bytes_hex + ('FF' * nr_bytes) + '\r', (2 * nr_bytes) + 1)  # Read rest of chars
+		Finally a copy of (updated part of) scratchpad is written to SRAM. Returns None if a step failed """
+
+		''' The data read continues the 'AA' command and its length depends on the auth respons: a bad frame in
+		either one replays both, from the addressing '''
+		for i in range(self.retries + 1):
+			if self.step(rom, b'A' + rom + b'\r', 17, retries=0, report=False) is None:  # Adressing
+				continue
+			auth = self.step(rom, 'W04AA' + ('FF' * 3) + '\r', 9, retries=0, report=False)  # 'AA' + TA1/TA2 + E/S
+			if auth is None:
+				continue
+			target_adr = (self.hex_byte_to_int(auth[4:6]) << 8) + self.hex_byte_to_int(auth[2:4])  # MSB and LSB Swapped
+			status = self.hex_byte_to_int(auth[6:8])
+			print(" read_and_copy_ds2423_scratchpad: auth, targetAdress, Status(E/S) 'Ending offset': ",
+			      auth, hex(target_adr), hex(status & 0x1F))
+
+			''' Continue reading timeslots until end of written part of scratchpad '''
+			nr_bytes = (status & 0x1F) - (target_adr & 0x1F) + 1  # 1+Ending offset-Start offset = # bytes written/to read
+			if nr_bytes < 1:
+				break  # Nothing (valid) written to scratchpad
+			nr_bytes_hex = self.int8_to_2hex_string(nr_bytes)
+			data = self.step(rom, 'W' + nr_bytes_hex + ('FF' * nr_bytes) + '\r', (2 * nr_bytes) + 1,
+			                 retries=0, report=False)  # Read rest of chars
+			if data is not None:
+				break
+		else:
+			self._failed(rom, 'W04AA')
+			return None
+		if nr_bytes < 1:
+			self.tx_rx('R\r', 1)
+			print(" read_and_copy_ds2423_scratchpad: Empty scratchpad: ", auth)
+			return None
 
-		dummy = self.tx_rx('M\r', 17)  # Reset and adress again
+		if self.step(rom, 'M\r', 17) is None:  # Reset and adress again
+			return None
 
 		""" Write Copy scratchpad command: copy scratchpad to memory –– Authenticate with previous TA1/TA2 + E/S """
 		a = list(auth[2:-1])
@@ -163,8 +190,10 @@ class HA7S:
 			s += chr(b)
 		##print("auth: ", a, chr(b), s)
 
-		resp = self.tx_rx('W045A' + s + '\r', 9)  # Copy Scratch: '5A' + TA1/TA2 + Status(E/S)
+		resp = self.step(rom, 'W045A' + s + '\r', 9)  # Copy Scratch: '5A' + TA1/TA2 + Status(E/S)
 		dummy = self.tx_rx('R\r', 1)  # Reset and stop
+		if resp is None:
+			return None
 
 		print(" read_and_copy_ds2423_scratchpad: Repons: ", resp[:-1], ':', data, nr_bytes)
 		return data
@@ -174,21 +203,22 @@ class HA7S:
 
 		page = page-number as integer [0..15]; the whole page is read.
 		If reading includes the last byte in a page, DS2423 also sends counter value(4 bytes) + 12 bytes more
-		Reading can continue into next page, BUT HA7S can only read 32 bytes in a chunk. """
+		Reading can continue into next page, BUT HA7S can only read 32 bytes in a chunk. Returns None if failed """
 
-		# Todo: check if respons = written; repeat otherwise
 		page_adr = self.int16_to_4hex_string((page % 16) * 0x20)
 		page_swap = page_adr[2:] + page_adr[:2]  # Swap MSB and LSB
 
-		resp = self.tx_rx(b'A' + rom + '\r', 17)  # Adressing
-
 		""" Write/read block: A5 01C0/01E0(CounterA/B) [or ANY PAGE (= adr)] + 'FF'*42 (timeslots during which slave
 		returns	32 ramData + 4(cntA/cntB) + 2(0) + 2 CRC bytes; All data as hex ascii (Byte reversed) """
-		data1 = self.tx_rx('W13F0' + page_swap + 'FF' * 16 + '\r', 39)  # Read mem + TA1/TA2 (adr = 0x01E0)
-		''' We can continue sending timeslots for reading data until we send Reset '''
-		data2 = self.tx_rx('W10' + 'FF' * 16 + '\r', 33)  # Continue fetching ram data
+		''' We can continue sending timeslots for reading data until we send Reset; the continuation can't be
+		replayed on its own, so a bad frame replays from the 'F0' block '''
+		resp = self.step_blocks(rom, (('W13F0' + page_swap + 'FF' * 16 + '\r', 39),  # Read mem + TA1/TA2 (adr = 0x01E0)
+		                              ('W10' + 'FF' * 16 + '\r', 33)))  # Continue fetching ram data
 
 		dummy = self.tx_rx('R\r', 1)  # Reset and stop reading
+		if resp is None:
+			return None
+		data1, data2 = resp
 
 		##print("Repons: ", resp, data1, data2)
 
@@ -197,7 +227,7 @@ class HA7S:
 		return (d, s)
 
 	def lcd_init(self, rom, use_custom_chars=True):
-		""" Init LCD with custom chr generator """
+		""" Init LCD with custom chr generator; returns False if a step failed (LCD may still point to CG-RAM) """
 
 		if use_custom_chars:
 			# Load Character generator into user area of CG-RAM
@@ -212,28 +242,38 @@ class HA7S:
 			        0b00000, 0b01010, 0b00000, 0b01110, 0b10001, 0b10001, 0b01110, 0b00000]  # 'ö' finns i #239
 
 			''' First adress PIC via HA7Scommand "A" '''
-			dummy = self.tx_rx(b'A' + rom + b'\r', 17)  # Adressing
-			dummy = self.tx_rx('W021040\r', 5)  # Write 0x40 directly to LCD register: Set start adr = 0 in CG-RAM
+			self.lcd_adr.pop(rom, None)  # LCD adr counter will be changed
+			if self.step(rom, b'A' + rom + b'\r', 17) is None:  # Adressing
+				return False
+			if self.step(rom, 'W021040\r', 5) is None:  # Write 0x40 directly to LCD register: Set start adr = 0 in CG-RAM
+				return False
 			delay(1)
-			dummy = self.tx_rx('M\r', 17)               # Reset AND reselect
+			if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect
+				return False
 
 			for c in chr0:  # Send chr0 to LCD CG-RAM (max 8 chrs á 8 bytes)
-				dummy = self.tx_rx('W0212' + self.bin2hex(chr(c)) + '\r', 5)  # Write font (chr0) to LCD CG-RAM
+				''' No replay: a byte written twice would shift the rest of CG-RAM. Caller can run lcd_init again '''
+				if self.step(rom, 'W0212' + self.bin2hex(chr(c)) + '\r', 5, retries=0) is None:  # Write font to CG-RAM
+					return False
 				delay(1)
-				dummy = self.tx_rx('M\r', 17)           # Reset AND reselect
+				if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect
+					return False
 
 			# Switch back to pointing to DDRAM (NOT CGRAM), else will clobber CGRAM !!
 			# self.hal_write_command(0x80 | 0)          # Set start adr = 0
-			dummy = self.tx_rx('W021080\r', 5)  # Write 0x40 directly to LCD register memory: Point to CDDRAM
+			if self.step(rom, 'W021080\r', 5) is None:  # Write 0x40 directly to LCD register memory: Point to CDDRAM
+				return False
 			delay(1)
-			dummy = self.tx_rx('R\r', 17)               # Reset
+			dummy = self.tx_rx('R\r', 1)                # Reset
+		return True
 
 	def print_on_lcd(self, rom, msg, row_nr, col=0, clear_LCD=False, use_custom_chars=False):
 		""" Send text message to scratchpad memory in PIC with HA7S Write/Read block cmd
 		then copy from scratchpad to LCD
 
 		N.B. swedish char åäöÅÄÖ and other non US-ASCII charas are sent as UTF-8 (2 chars)
-		entries in user_char with chr >127, does not work? """
+		entries in user_char with chr >127, does not work?
+		Returns False if a step failed after its retries (see step) """
 
 		user_char = {'Ä': chr(0), 'Ö': chr(1), 'Å': chr(2), 'å': chr(3),  # Custom chr in CGRAM
 		             '°': chr(4), 'g': chr(5),  # Custom chr in CGRAM
@@ -241,17 +281,21 @@ class HA7S:
 		             '∑': chr(246), 'Ω': chr(244), 'µ': chr(228)}  # todo: investigeate if works if > 127
 
 		# Row nr to LCD memory adr for start of row [0–3]   [Valid for 4 rows x 20 chars LCD ONLY]
-		lcd_row_adr = {0: 0x00, 1: 0x40, 2: 0x14, 3: 0x54}
+		lcd_row_adr = self.LCD_ROW_ADR
+		self.lcd_adr.pop(rom, None)  # LCD adr counter will be changed
 
 		''' First adress LCD kontroller via HA7Scommand "A" '''
-		dummy = self.tx_rx(b'A' + rom + b'\r', 17)  # Adressing
+		if self.step(rom, b'A' + rom + b'\r', 17) is None:  # Adressing
+			return False
 
 		if clear_LCD:
 			''' Clear display first '''
 			delay(1)
-			dummy = self.tx_rx('W0149\r', 3)    # Write block '49' 1 byte: Clear LCD
+			if self.step(rom, 'W0149\r', 3) is None:  # Write block '49' 1 byte: Clear LCD
+				return False
 			delay(3)
-			dummy = self.tx_rx('M\r', 17)       # Reset AND reselect
+			if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect
+				return False
 
 		line_adr = self.bin2hex(chr(lcd_row_adr[row_nr] + col))  # LCD memory adr to use on LCD for chosen row
 
@@ -276,56 +320,197 @@ class HA7S:
 		''' Can only transfer max 16 chars to scratchpad LCD memory per transfer: First tfr 16 chrs + 2nd tfr for rest '''
 		if msg_len > 16:
 			len_hex = self.bin2hex(chr(16 + 2))  # Limit to 16 + 2 bytes first transmission
-			dummy = self.tx_rx('W' + len_hex + '4E' + line_adr + msg_hex[:16 * 2] + '\r', 37)  # Write first 16 chars to
-			# scratchpad
+			if self.step(rom, 'W' + len_hex + '4E' + line_adr + msg_hex[:16 * 2] + '\r', 37) is None:  # First 16 chars
+				return False
 			delay(1)
-			dummy = self.tx_rx('M\r', 17)       # Reset AND reselect
-			dummy = self.tx_rx('W0148\r', 3)    # Copy Scratchpad to LCD
+			if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect
+				return False
+			if self.step(rom, 'W0148\r', 3) is None:  # Copy Scratchpad to LCD
+				return False
 			''' Adjust parameters for next part of msg to write to LCD memory '''
 			msg_len -= 16
 			msg_hex = msg_hex[16 * 2:]          # keep unsent part only
 			line_adr = self.bin2hex(chr(lcd_row_adr[row_nr] + col + 16))  # LCD memory adr to use on LCD for 17:th
 			# char
-			dummy = self.tx_rx('M\r', 17)       # Reset AND reselect (enl HA7S doc)
+			if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect (enl HA7S doc)
+				return False
 
 		len_hex = self.bin2hex(chr(msg_len + 2))  # Len = BYTE count for remaining data
-		dummy = self.tx_rx('W' + len_hex + '4E' + line_adr + msg_hex + '\r', len(msg_hex) + 5)  # Write to scratchpad
+		if self.step(rom, 'W' + len_hex + '4E' + line_adr + msg_hex + '\r', len(msg_hex) + 5) is None:  # Write to scratchpad
+			return False
 		delay(1)
-		resp1 = self.tx_rx('M\r', 17)           # Reset AND reselect
-		dummy = self.tx_rx('W0148\r', 3)        # Copy Scratchpad to LCD
+		if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect
+			return False
+		if self.step(rom, 'W0148\r', 3) is None:  # Copy Scratchpad to LCD
+			return False
 		delay(2)
 		''' Turn LCD back-light ON '''
-		dummy = self.tx_rx('M\r', 17)           # Reset AND reselect
-		dummy = self.tx_rx('W0108\r', 3)        # Write block '08' 1 byte: LCD backlight on
+		if self.step(rom, 'M\r', 17) is None:  # Reset AND reselect
+			return False
+		if self.step(rom, 'W0108\r', 3) is None:  # Write block '08' 1 byte: LCD backlight on
+			return False
 		dummy = self.tx_rx('R', 1)              # Reset
-
-	def tx_rx(self, tx, nr_chars):
-		""" Send command to and receive respons from SA7S"""
+		return True
+
+	def lcd_put_char(self, rom, row_nr, col, char):
+		""" Write one character to one cell of the LCD with minimal bus traffic.
+
+		Reselects with 'M' if rom is still addressed, and sets the LCD adr only if the adr counter isn't already
+		there (it steps one cell after each write), so typing a line costs 'M' + one 'W' block per character.
+		After a bad frame it is unknown where the adr counter is, so the whole sequence is redone (A, adr, char).
+		Returns False if all tries failed (counted as one failed step) """
+		cell = row_nr * self.ROW_LENGTH + col
+		tx = 'W0212%02X\r' % ord(char)
+		for i in range(self.retries + 1):
+			if self.selected == rom:
+				ok = self.step(rom, 'M\r', 17, 0, 1, retries=0, report=False)  # Reset AND reselect
+			else:
+				ok = self.step(rom, b'A' + rom + b'\r', 17, 0, 1, retries=0, report=False)  # Adressing
+			if ok is not None and self.lcd_cell_adr[cell] != self.lcd_adr.get(rom):
+				ok = self.step(rom, self.lcd_cell_cmd[cell], 5, 1, 1, retries=0, report=False)  # Set DDRAM adr
+				if ok is not None:
+					ok = self.step(rom, 'M\r', 17, 0, 1, retries=0, report=False)  # Reset AND reselect
+			if ok is not None:
+				ok = self.step(rom, tx, 5, 1, 1, retries=0, report=False)  # Write char to LCD data register
+			if ok is not None:
+				self.lcd_adr[rom] = self.lcd_cell_adr[cell] + 1
+				return True
+		self._failed(rom, tx)
+		return False
+
+	def step(self, rom, tx, nr_chars, settle_ms=84, poll_ms=10, retries=None, report=True):
+		""" One step of a transaction with rom: send tx and check the respons (see frame_ok)
+
+		On a short, garbled or late respons the HA7S is resynced, rom is addressed again and only tx is replayed
+		(an 'A' or 'M' step is then done already), at most retries times (default self.retries).
+		Returns the respons, or None if all tries failed. Counts in self.stats[rom]; report=False leaves
+		counting the failure to a caller that retries on its own """
+		st = self._stats(rom)
+		if retries is None:
+			retries = self.retries
+		adr = b'A' + rom + b'\r'
+		st[0] += 1
+		while True:
+			rx = self.tx_rx(tx, nr_chars, settle_ms, poll_ms)
+			if self.frame_ok(rom, tx, rx, nr_chars):
+				return rx
+			st[1] += 1
+			while retries > 0:
+				retries -= 1
+				self.resync()
+				rx = self.tx_rx(adr, 17)  # Adressing
+				if self.frame_ok(rom, adr, rx, 17):
+					break
+				st[1] += 1
+			else:
+				self.resync()
+				if report:
+					self._failed(rom, tx, rx)
+				return None
+			if tx[:1] in ('A', b'A', 'M', b'M'):
+				return rx
+
+	def step_blocks(self, rom, blocks, settle_ms=84, poll_ms=10):
+		""" Address rom and send blocks ((tx, nr_chars), …) that continue one 1-wire command
+
+		After a reset a continuation block means nothing on its own, so a bad frame replays all of them from the
+		addressing, at most self.retries times. Returns list of respons (one per block) or None """
+		st = self._stats(rom)
+		adr = b'A' + rom + b'\r'
+		for i in range(self.retries + 1):
+			if i:
+				self.resync()
+			resp = []
+			for tx, nr_chars in ((adr, 17),) + tuple(blocks):
+				st[0] += 1
+				rx = self.tx_rx(tx, nr_chars, settle_ms, poll_ms)
+				if not self.frame_ok(rom, tx, rx, nr_chars):
+					st[1] += 1
+					break
+				resp.append(rx)
+			else:
+				return resp[1:]
+		self.resync()
+		self._failed(rom, tx, rx)
+		return None
+
+	def frame_ok(self, rom, tx, rx, nr_chars):
+		""" True if rx is a complete respons to tx: nr_chars long, ending with '\r', hex only.
+		'A' and 'M' must return rom; a 'W' block must echo every byte written (not the 'FF' read timeslots) """
+		if len(rx) != nr_chars or rx[-1:] != b'\r':
+			return False
+		for c in rx[:-1]:
+			if c not in self.HEX:
+				return False
+		if isinstance(tx, str):
+			tx = tx.encode()
+		cmd = tx[:1]
+		if cmd in (b'A', b'M'):
+			return rx[:-1] == rom
+		if cmd == b'W':
+			w = tx[3:-1]  # Skip 'W' + byte count and '\r'
+			for i in range(0, len(w), 2):
+				if w[i:i + 2] != b'FF' and int(w[i:i + 2], 16) != int(rx[i:i + 2], 16):
+					return False
+		return True
+
+	def resync(self):
+		""" Get HA7S back in step after a bad frame: end any half received command, drop late bytes and reset """
+		self.uart.write(b'\r')
+		delay(10)
+		while self.uart.any():  # Late or garbled respons
+			self.uart.read(self.uart.any())  # Only what's there: read() waits for the UART timeout (1 s)
+			delay(10)
+		self.tx_rx('R', 1, settle_ms=0, poll_ms=1)  # Reset
+		self.lcd_adr.clear()  # A write may or may not have reached an LCD
+
+	def _stats(self, rom):
+		st = self.stats.get(rom)
+		if st is None:
+			st = self.stats[rom] = [0, 0, 0]
+		return st
+
+	def _failed(self, rom, tx, rx=None):
+		self._stats(rom)[2] += 1
+		print("HA7S step failed: rom, tx, rx: ", rom, tx, rx)
+
+	def error_rate(self, rom):
+		""" Bad frames per step for rom (0.0 if never used) """
+		st = self.stats.get(rom)
+		return st[1] / st[0] if st else 0.0
+
+	def tx_rx(self, tx, nr_chars, settle_ms=84, poll_ms=10):
+		""" Send command to and receive respons from SA7S
+
+		settle_ms: wait after the respons; poll_ms: interval while waiting for the respons.
+		Waits at most self.timeout_ms: a late respons is returned short (b'' if none at all) """
+		if tx[:1] in ('A', b'A'):
+			self.selected = tx[1:-1]
+		elif tx[:1] not in ('M', b'M', 'W', b'W'):
+			self.selected = None  # Reset or search
 		''' rx = uart.readall() # Receive respons TAKES 1.0 sec ALWAYS (after uart.any) TimeOut!!!! '''
-		i = 0
-		rx = ''
-		# todo: do check if respons == same as sent: repeat otherwise
+		if self.uart.any():
+			self.uart.read(self.uart.any())  # Drop late respons to an earlier command
+		rx = b''
 		self.uart.write(tx)  # Send to unit
-		# print("uart.write: i, tx: ", i,  tx[:-1])
-		while True:  # Typiskt 2–3 (search: 4) varv i loopen
-			i += 1
-			if self.uart.any():  # returns True if any characters wait
-				dbg.high()
-				strt = micros()
-				rx = b''
-				j = 0
-				while True:  # Typically 10–20 (search: 12; M, R & W0144: 1) loops
-					j += 1
-					rxb = self.uart.read(nr_chars)  # uart.readln och uart.readall ger båda timeout (1s default)
-					rx = rx + rxb
-					if (len(rx) >= nr_chars) or (rxb == b'\r'):  # End of search returns \r
-						break
-				dbg.low()
-				##print("uart.read: i, j, tx, rx, ∆time ", i, j, tx[:-1], rx, len(rx), elapsed_micros(strt) / 1e6, 's')
-				delay(84)
+		strt = millis()
+		while not self.uart.any():  # Typiskt 2–3 (search: 4) varv i loopen
+			if elapsed_millis(strt) > self.timeout_ms:
+				return rx
+			delay(poll_ms)
+		if self.dbg:
+			self.dbg.high()
+		while True:  # Typically 10–20 (search: 12; M, R & W0144: 1) loops
+			rxb = self.uart.read(nr_chars)  # uart.readln och uart.readall ger båda timeout (1s default)
+			if rxb:
+				rx = rx + rxb
+			if (len(rx) >= nr_chars) or (rxb == b'\r'):  # End of search returns \r
 				break
-			else:
-				delay(10)
+			if elapsed_millis(strt) > self.timeout_ms:
+				break
+		if self.dbg:
+			self.dbg.low()
+		delay(settle_ms)
 		return rx
 
 	def hex_bytes_to_str(self, s):
@@ -403,12 +588,14 @@ class HA7S:
 #   Main
 #
 if __name__ == "__main__":
+	from Lib_samplelog import SampleLog
+
 	dbg = Pin("X9", Pin.OUT_PP)  # Debug pin
 	dbg.low()
 
 	print("\nSöker efter alla enheter på 1wire-bussen…")
 
-	one_w = HA7S(4)  # Create & init 1wire master on uart port #4
+	one_w = HA7S(4, dbg)  # Create & init 1wire master on uart port #4
 
 	""" Discover all Devices """
 	rom_codes = one_w.scan_for_devices()
@@ -418,8 +605,11 @@ if __name__ == "__main__":
 
 	cntr_rom = b'F60000000CDFAD1D'  # DS2423 counter ROM code
 	lcd_rom = b'68000100000903FF'
+	log = SampleLog('/flash/ha7s_log')  # Binary log of readings; device index = index in rom_codes
 	count = one_w.read_ds2423_counters(cntr_rom)
 	print("Counter A, B: ", count)
+	if cntr_rom in rom_codes:
+		log.log_counters(rom_codes.index(cntr_rom), count)
 
 	"""# Fill all SRAM with <spc> chr
 	for page in range(0, 16):
@@ -440,14 +630,19 @@ if __name__ == "__main__":
 
 	""" For all DS18B02: read temp and display """
 	i = 0
-	for u in rom_codes:
+	for dev, u in enumerate(rom_codes):
 		if u[-2:] == b'28':  # Family = DS18B20
 			temp = one_w.read_ds18b20_temp(u)  # Read temp from one DS18B20
+			log.log_temp(dev, temp)
 			msg = "Temp: " + str(temp) + '°C'
 			# print(msg)
 			strt = micros()
 			##one_w.print_on_lcd(lcd_rom, msg, i+1)
 			i += 1
 		##print("DeltaT: ", elapsed_micros(strt) / 1e6)
+	log.flush()
+
+	for u in rom_codes:
+		print("Steps, bad frames, failed steps: ", u, one_w.stats.get(u), one_w.error_rate(u))
 
 print()
@@ -0,0 +1,224 @@
+"""Compact append-only binary log of sensor samples on flash, with query by time range.
+
+Records are fixed width (12 bytes): timestamp [s], value, device index, kind. They are collected in RAM and
+written in batches to a ring of preallocated segment files. Each segment has a small index with the
+timestamp of every block'th record, so a time range is found with a few seeks instead of parsing all data.
+
+Segment file layout:
+	header  HDR_FMT:    magic, seq (0 = empty, higher = newer), nr of records, block
+	index   nr_idx x 4: timestamp of record 0, block, 2 * block, …
+	data    seg_records x REC_SIZE
+"""
+__author__ = 'folke'
+
+import os
+import struct
+
+try:
+	from utime import time
+except ImportError:
+	from time import time
+
+REC_FMT = '<IiBB2x'     # timestamp, value, device index, kind
+REC_SIZE = 12
+HDR_FMT = '<4sIII'      # magic, seq, count, block
+HDR_SIZE = 16
+MAGIC = b'SLG1'
+
+# Kinds of samples
+TEMP = 0                # DS18B20 temperature, value in 1/16 °C
+CNT_A = 1               # DS2423 counter A
+CNT_B = 2               # DS2423 counter B
+
+
+class SampleLog:
+	""" Ring of nr_segs segment files '<path><n>.bin' with seg_records records each.
+
+	log() / log_temp() / log_counters() buffer records; flush() writes them (done automatically
+	when batch records are buffered). When the newest segment is full, the oldest is reused.
+	query(t_from, t_to) yields (timestamp, device, kind, value) in time order; timestamps must not
+	decrease between calls to log()
+	Defaults need 4 x 6192 bytes; the pyboard's internal /flash is only ≈100 kB, use an SD card for long logs """
+
+	def __init__(self, path='/flash/log', nr_segs=4, seg_records=512, block=64, batch=32):
+		self.path = path
+		self.nr_segs = nr_segs
+		self.seg_records = seg_records
+		self.block = block
+		self.nr_idx = (seg_records + block - 1) // block
+		self.data_ofs = HDR_SIZE + 4 * self.nr_idx
+		self.batch = batch
+		self.buf = bytearray(REC_SIZE * batch)      # Records not yet written
+		self.nr_buf = 0
+		self.idx_buf = bytearray(4)
+
+		''' Find newest segment; create (preallocate) missing segment files '''
+		self.seg = 0
+		self.seq = 0
+		self.count = 0
+		missing = []
+		for i in range(nr_segs):
+			hdr = self._read_header(i)
+			if hdr is None:
+				missing.append(i)
+			elif hdr[0] > self.seq:
+				self.seg, self.seq, self.count = i, hdr[0], hdr[1]
+		if missing:
+			self._check_space(len(missing) * self.seg_size())
+		for i in missing:
+			self._create(i)
+		if not self.seq:
+			self.seq = 1
+			self._write_header(self.seg, self.seq, 0)
+
+	def seg_name(self, i):
+		return '%s%d.bin' % (self.path, i)
+
+	def seg_size(self):
+		return self.data_ofs + self.seg_records * REC_SIZE
+
+	def log(self, dev, value, kind=TEMP, t=None):
+		if t is None:
+			t = int(time())  # CPython time() is a float
+		struct.pack_into(REC_FMT, self.buf, self.nr_buf * REC_SIZE, t, value, dev, kind)
+		self.nr_buf += 1
+		if self.nr_buf >= self.batch:
+			self.flush()
+
+	def log_temp(self, dev, temp, t=None):
+		""" Temperature [°C] as returned by HA7S.read_ds18b20_temp (None is skipped) """
+		if temp is not None:
+			self.log(dev, int(round(temp * 16)), TEMP, t)
+
+	def log_counters(self, dev, counts, t=None):
+		""" (cntA, cntB) as returned by HA7S.read_ds2423_counters (None is skipped) """
+		if counts is None:
+			return
+		if t is None:
+			t = int(time())
+		self.log(dev, _to_int32(counts[0]), CNT_A, t)
+		self.log(dev, _to_int32(counts[1]), CNT_B, t)
+
+	def flush(self):
+		""" Write buffered records; one open + sequential write per segment touched """
+		i = 0
+		while i < self.nr_buf:
+			if self.count >= self.seg_records:
+				self._rotate()
+			n = min(self.nr_buf - i, self.seg_records - self.count)
+			with open(self.seg_name(self.seg), 'r+b') as f:
+				f.seek(self.data_ofs + self.count * REC_SIZE)
+				f.write(memoryview(self.buf)[i * REC_SIZE:(i + n) * REC_SIZE])
+				''' Index entries for records starting a block '''
+				first = (self.count + self.block - 1) // self.block
+				for b in range(first, (self.count + n - 1) // self.block + 1):
+					r = i + b * self.block - self.count
+					self.idx_buf[:] = self.buf[r * REC_SIZE:r * REC_SIZE + 4]   # Timestamp of record
+					f.seek(HDR_SIZE + 4 * b)
+					f.write(self.idx_buf)
+				self.count += n
+				f.seek(0)
+				f.write(struct.pack(HDR_FMT, MAGIC, self.seq, self.count, self.block))
+			i += n
+		self.nr_buf = 0
+
+	def query(self, t_from, t_to):
+		""" Yield (timestamp, device, kind, value) for t_from <= timestamp <= t_to, also not flushed ones """
+		segs = []
+		for i in range(self.nr_segs):
+			hdr = self._read_header(i)
+			if hdr and hdr[0] and hdr[1]:
+				segs.append((hdr[0], i, hdr[1]))
+		segs.sort()
+		for seq, i, count in segs:
+			with open(self.seg_name(i), 'rb') as f:
+				nr_idx = (count + self.block - 1) // self.block
+				idx = f.read(HDR_SIZE + 4 * nr_idx)[HDR_SIZE:]
+				if struct.unpack_from('<I', idx, 0)[0] > t_to:
+					continue
+				f.seek(self.data_ofs + (count - 1) * REC_SIZE)
+				if struct.unpack_from('<I', f.read(REC_SIZE), 0)[0] < t_from:
+					continue
+				''' Binary search: last block starting before t_from '''
+				lo, hi = 0, nr_idx - 1
+				while lo < hi:
+					mid = (lo + hi + 1) // 2
+					if struct.unpack_from('<I', idx, 4 * mid)[0] < t_from:
+						lo = mid
+					else:
+						hi = mid - 1
+				r = lo * self.block
+				f.seek(self.data_ofs + r * REC_SIZE)
+				while r < count:
+					n = min(self.block, count - r)
+					data = f.read(n * REC_SIZE)
+					for j in range(n):
+						rec = _unpack(data, j * REC_SIZE)
+						if rec[0] > t_to:
+							return
+						if rec[0] >= t_from:
+							yield rec
+					r += n
+		for j in range(self.nr_buf):
+			rec = _unpack(self.buf, j * REC_SIZE)
+			if t_from <= rec[0] <= t_to:
+				yield rec
+
+	def _rotate(self):
+		""" Continue in the oldest segment """
+		self.seg = (self.seg + 1) % self.nr_segs
+		self.seq += 1
+		self.count = 0
+		self._write_header(self.seg, self.seq, 0)
+
+	def _create(self, i):
+		""" Preallocate segment file (zeros) with empty header """
+		zeros = bytearray(512)
+		size = self.seg_size()
+		with open(self.seg_name(i), 'wb') as f:
+			while size > 0:
+				f.write(zeros if size >= 512 else zeros[:size])
+				size -= 512
+		self._write_header(i, 0, 0)
+
+	def _check_space(self, need):
+		""" Raise OSError before preallocating if the filesystem can't hold need bytes more """
+		d = self.path[:self.path.rfind('/')] or '/'
+		try:
+			st = os.statvfs(d)
+		except (AttributeError, OSError):
+			return  # No statvfs: let _create fail instead
+		free = st[1] * st[4]  # f_frsize * f_bavail
+		if need > free:
+			raise OSError('SampleLog: %d bytes needed on %s, %d free; lower seg_records or nr_segs' % (need, d, free))
+
+	def _read_header(self, i):
+		""" (seq, count) or None if missing or not a segment of this layout """
+		try:
+			if os.stat(self.seg_name(i))[6] != self.seg_size():
+				return None
+			with open(self.seg_name(i), 'rb') as f:
+				magic, seq, count, block = struct.unpack(HDR_FMT, f.read(HDR_SIZE))
+		except OSError:
+			return None
+		if magic != MAGIC or block != self.block:
+			return None
+		return seq, count
+
+	def _write_header(self, i, seq, count):
+		with open(self.seg_name(i), 'r+b') as f:
+			f.write(struct.pack(HDR_FMT, MAGIC, seq, count, self.block))
+
+
+def _to_int32(v):
+	""" Unsigned 32 bits counter to signed, as stored """
+	return v - (1 << 32) if v >= (1 << 31) else v
+
+
+def _unpack(data, ofs):
+	t, value, dev, kind = struct.unpack_from(REC_FMT, data, ofs)
+	if kind == TEMP:
+		value /= 16
+	elif value < 0:
+		value += 1 << 32            # Counters are unsigned
+	return t, dev, kind, value
@@ -1,25 +1,24 @@
 """Functions for scanning keypad, debouncing and decoding pressed keys.
 
-Uses a callback for timer 4 @50–100 Hz and in-line assembler for the scan function
+Class Keypad scans any N x M matrix on configurable pins using a callback for a timer @50–100 Hz,
+debounces in viper and exports press/release/long-press/auto-repeat events with timestamps via a FIFO.
+For the 3 x 4 keypad on GPIOC it calls an in-line assembler function for the scan (scan_keys).
+Optionally the timer only runs while keys are touched: when idle, all columns are driven low
+and a falling edge on any row (EXTI) starts the timer again.
+The settle delay per column can be measured at startup (Keypad.calibrate) and the callback
+profiled with Lib_profiler.ISRProfiler
 
 2015-06-07 by Folke Berglund """
 
 import stm
-from pyb import Pin, delay, micros, elapsed_micros, Timer
+import machine
+from pyb import Pin, ExtInt, delay, micros, millis, elapsed_micros, Timer
 from Lib_fifo import FIFO
-# import array
-
-"""# Globals for communication with timer callback routine
-key_last    = 0
-key_old     = 0
-key_flag    = 0
-key_buf     = array.array('i', [0]*25)      # Room for 20 key presses/releases"""
+from utime import ticks_cpu, ticks_diff
+import array
 
 # Constants
-NONE        = 0             # No key pressed
-NEW         = 3             # key_flag = 3 means it's debounced and New
-USED        = 4             # key_flag = 4 means consumer has received symbol (Not New anymore)
-DEL_CNT     = const(100)    # Delay when scanning before reading (≈4 µs)
+DEL_CNT     = const(100)    # Delay when scanning before reading (≈4 µs @168 MHz)
 
 
 def port_init():
@@ -44,19 +43,23 @@ def port_init():
 
 
 @micropython.asm_thumb
-def scan_keys():
+def scan_keys(r0):
 	""" Scan All 3 columns for pressed/released keys.
 
-	Calling function takes ≈ 5 / 17 µs when [no key] / [key pressed]
+	Calling function takes ≈ 5 / 17 µs when [no key] / [key pressed] with r0 = DEL_CNT
+	At entry:
+		r0 = nr of delay loops before reading each column (DEL_CNT, or see settle_del_cnt)
 	Register usage;
 		r7 -> GPIOC base
 		r6 = mask for GPIO_C7 used as indicator (low while scanning)
 		r5 = 8 used for shifts lsl
+		r4 = delay count
 		r3 = mask for key readout bits
 	At exit:
 		r0 = key data for col0/col1/col2 MSB//LSB
 			4 of 8 bits each used for rowNr (1(toprow), 2, 4 or 8) for pressed key(s)
 	"""
+	mov(r4, r0)                     # r4 = delay count (argument)
 	# r7 -> GPIOC base address
 	movwt(r7, stm.GPIOC)            # r7 -> Base of PortC
 	# First check if ANY key pressed
@@ -67,25 +70,24 @@ def scan_keys():
 	# Prepare for inverting and masking col- and key-bits
 	mov(r6, 0b10000000)             # Prepare for setting C7 high at exit
 	mov(r5, 8)                      # r5 = nr shifts for lsl
-	mov(r4, 0b01111111)
 	mov(r3, 0b1111)                 # Mask for key readout bits
 
 	ldrb(r0, [r7, stm.GPIO_IDR])    # Read 8 bits from input to r0
-	eor(r0, r4)
+	mvn(r0, r0)                     # Inverted logic
 	and_(r0, r3)                    # Keep only key bits
 	beq(EXIT_NO_KEY)                # No key pressed, exit with r0 = 0
 
 	mov(r1, 0b01100000)
 	strh(r1, [r7, stm.GPIO_BSRRL])  # Set two Columns high and keep C4 low
 
-	# delay for a while (≈4 µs)
-	movwt(r2, DEL_CNT)
+	# delay for a while (≈4 µs @ DEL_CNT)
+	mov(r2, r4)
 	label(delay_0)
 	sub(r2, r2, 1)
 	bne(delay_0)
 
 	ldrb(r0, [r7, stm.GPIO_IDR])    # Read 8 bits from col0 keys to r0
-	eor(r0, r4)
+	mvn(r0, r0)                     # Inverted logic
 	and_(r0, r3)                    # Keep only key bits
 	lsl(r0, r5)                     # Make room for next col
 
@@ -94,14 +96,14 @@ def scan_keys():
 	mov(r1, 0b00100000)
 	strh(r1, [r7, stm.GPIO_BSRRH])  # (Re)set col1 C5 low (active)
 
-	# delay for a while (≈4 µs)
-	movwt(r2, DEL_CNT)
+	# delay for a while (≈4 µs @ DEL_CNT)
+	mov(r2, r4)
 	label(delay_1)
 	sub(r2, r2, 1)
 	bne(delay_1)
 
 	ldrb(r1, [r7, stm.GPIO_IDR])    # Read 8 bits from col1 keys to r1
-	eor(r1, r4)
+	mvn(r1, r1)                     # Inverted logic
 	and_(r1, r3)                    # Keep only key bits
 	orr(r0, r1)                     # Add data to previous col
 	lsl(r0, r5)                     # Make room for next col
@@ -111,14 +113,14 @@ def scan_keys():
 	mov(r2, 0b01000000)
 	strh(r2, [r7, stm.GPIO_BSRRH])  # (Re)set col2 C6 low (active)
 
-	# delay for a while (≈4 µs)
-	movwt(r2, DEL_CNT)
+	# delay for a while (≈4 µs @ DEL_CNT)
+	mov(r2, r4)
 	label(delay_2)
 	sub(r2, r2, 1)
 	bne(delay_2)
 
 	ldrb(r2, [r7, stm.GPIO_IDR])    # Read 8 bits from col2 keys to r2
-	eor(r2, r4)
+	mvn(r2, r2)                     # Inverted logic
 	and_(r2, r3)                    # Keep only key bits
 	orr(r0, r2)                     # Add data to previous cols
 	''' r0 now contains all 3 key-data; col0 as MSB and col2 as LSB '''
@@ -128,120 +130,491 @@ def scan_keys():
 
 #################################
 #
-#   Callback for keypad scanner
+#   Settle time calibration
 #
-@micropython.native
-def scan_timer_callback(timer):  # Called @50–100 Hz by Timer
-	"""Callback for Timer. Scan keypad and debounce. Takes 13 / 26 µs [no key] / [key pressed].
-	Returns key(s) in key_buf (FIFO)
-		key_debounce: key_flag:
-			0 : key changed (pressed or released)
-			1 : 1:st debounce cycle
-			2 : 2:nd debounce cycle
-			3 : Valid (still pressed) = NEW (export)
-			4 : Acknowledged (set to USED by consumer) and not considered new anymore
-	"""
-
-	global key_last, key_old, key_flag, key_buf
-
-	key_last = scan_keys()      # Call Assembler routine
-	if key_last == key_old:
-		if key_flag == 2:       # EXPORT key
-			fifo.put(key_buf, key_last)
-			key_flag = NEW      # = 3 One loop more so we don't come back here (When Consumer clears key_flag)
-		elif key_flag < 2:
-			key_flag += 1       # One loop more
-		else:
-			pass                # Do nothing: Wait until keys change
-	else:
-		key_flag = NONE         # = 0 New key or key released
-		key_old = key_last      # Key changed!: wait till next scans and check if stable
+@micropython.asm_thumb
+def asm_spin(r0):
+	""" Same delay loop as in scan_keys: r0 turns """
+	label(loop)
+	sub(r0, r0, 1)
+	bne(loop)
+
+
+@micropython.viper
+def viper_spin(n: int):
+	""" Same delay loop as in scan_port: n turns """
+	while n > 0:
+		n -= 1
+
+
+@micropython.viper
+def rise_count(gpio: int, mask: int, max_cnt: int) -> int:
+	""" Pull the open drain pin(s) in mask low, release them and count loop turns until they read high.
+
+	mask = 0 gives max_cnt turns (used to time the loop itself) """
+	bsrr = ptr32(gpio + int(stm.GPIO_BSRRL))
+	idr = ptr16(gpio + int(stm.GPIO_IDR))
+	bsrr[0] = mask << 16            # Low
+	d = 1000
+	while d > 0:                    # Discharge line
+		d -= 1
+	bsrr[0] = mask                  # Release: pull-up makes it rise
+	n = 0
+	while n < max_cnt:
+		if idr[0] & mask:
+			break
+		n += 1
+	return n
+
+
+def cycles_per_turn(f, *args):
+	""" CPU cycles per loop turn of f, where the last argument is the nr of turns """
+	t = ticks_cpu()
+	f(*args, 10001)
+	d = ticks_diff(ticks_cpu(), t)
+	t = ticks_cpu()
+	f(*args, 1)
+	return (d - ticks_diff(ticks_cpu(), t)) / 10000
+
+
+def del_cnt_from_freq():
+	""" DEL_CNT was tuned to ≈4 µs at 168 MHz; scale it to the actual clock """
+	return max(1, DEL_CNT * machine.freq()[0] // 168000000)
+
+
+def settle_del_cnt(pins, spin=asm_spin, margin=2, trials=8):
+	""" Measure settle time of the (column) pins and convert to delay count for spin (asm_spin or viper_spin).
+
+	Rows and columns have the same kind of pull-up and similar capacitance, so the time for a released
+	column to read high is used for the time a row needs after the column of a pressed key is released.
+	Uses the worst of trials * margin. Falls back on del_cnt_from_freq() if a pin never reads high """
+	max_cnt = 10000
+	turn = cycles_per_turn(rise_count, pins[0].gpio(), 0)
+	worst = 0
+	for p in pins:
+		for _ in range(trials):
+			n = rise_count(p.gpio(), 1 << p.pin(), max_cnt)
+			if n >= max_cnt:
+				return del_cnt_from_freq()  # Stuck low (key pressed?)
+			worst = max(worst, n)
+	settle = (worst + 1) * turn * margin     # [cycles]
+	return max(1, int(settle / cycles_per_turn(spin)) + 1)
+
+# Lookup tables for key-code to character, built once at import
+# Can handle up to 2 chrs in same column (per column)
+#
+# Connected to PortC as  inputs: C0 – C3 to row 0 – 3 ('123'  to '*0#')  pull-up
+#                       outputs: C4 – C6 to col 0 – 2 ('147*' to '369#') pull-up, open drain, active low
+#
+# Each table has 16 entries indexed by the 4 row bits of one column; '' if no key or more than 2 keys in column
+_COL0 = {1: '1', 2: '4', 3: '14', 4: '7', 5: '17', 6: '47', 8: '*', 9: '*1', 10: '*4', 12: '*7'}
+_COL1 = {1: '2', 2: '5', 3: '25', 4: '8', 5: '28', 6: '58', 8: '0', 9: '20', 10: '50', 12: '80'}
+_COL2 = {1: '3', 2: '6', 3: '36', 4: '9', 5: '39', 6: '69', 8: '#', 9: '3#', 10: '6#', 12: '9#'}
+
+COL0_SYMB = tuple(_COL0.get(rc, '') for rc in range(16))
+COL1_SYMB = tuple(_COL1.get(rc, '') for rc in range(16))
+COL2_SYMB = tuple(_COL2.get(rc, '') for rc in range(16))
+
+# Chords over columns: each column has 11 distinct symbol strings, so the 4 row bits map to an index 0–10.
+# The table of all 11 x 11 x 11 concatenations (1331 short strings, ≈50 kB of RAM) is built by chord_table()
+# on first use only; Keypad itself decodes with its keymap and never needs it
+_VAL0 = [''] + [_COL0[rc] for rc in sorted(_COL0)]
+_VAL1 = [''] + [_COL1[rc] for rc in sorted(_COL1)]
+_VAL2 = [''] + [_COL2[rc] for rc in sorted(_COL2)]
+COL0_IDX = tuple(_VAL0.index(s) * 121 for s in COL0_SYMB)
+COL1_IDX = tuple(_VAL1.index(s) * 11 for s in COL1_SYMB)
+COL2_IDX = tuple(_VAL2.index(s) for s in COL2_SYMB)
+_chords = None
+
+
+def chord_table():
+	""" Build (once) and return the chord table; call it at setup if chords are decoded in a callback """
+	global _chords
+	if _chords is None:
+		_chords = tuple(s0 + s1 + s2 for s0 in _VAL0 for s1 in _VAL1 for s2 in _VAL2)
+	return _chords
 
 
 @micropython.native
 def key_to_symbol(key):
 	""" Translate key to key_symbol(s).
 
-	Return string: active key's symbols; empty if no key pressed """
+	Constant time: one table lookup per column. When only one column is active (the normal case)
+	the interned table entry is returned as is, so nothing is allocated and it's safe in a callback.
+	Chords over columns are looked up in chord_table(), which allocates once when first built.
 
-	# Dictionary with lookUp tables for key-code to character
-	# Can handle up to 2 chrs in same column (per column)
-	#
-	# Connected to PortC as  inputs: C0 – C3 to row 0 – 3 ('123'  to '*0#')  pull-up
-	#                       outputs: C4 – C6 to col 0 – 2 ('147*' to '369#') pull-up, open drain, active low
-	#
-	COL0 = {1: '1', 2: '4', 3: '14', 4: '7', 5: '17', 6: '47', 8: '*', 9: '*1', 10: '*4', 12: '*7'}
-	COL1 = {1: '2', 2: '5', 3: '25', 4: '8', 5: '28', 6: '58', 8: '0', 9: '20', 10: '50', 12: '80'}
-	COL2 = {1: '3', 2: '6', 3: '36', 4: '9', 5: '39', 6: '69', 8: '#', 9: '3#', 10: '6#', 12: '9#'}
-
-	def _2_symbol(rc, c_dict):
-		_list = []
-		for k, v in c_dict.items():
-			if k == rc:
-				_list.append(v)
-		if _list:                       # If more than 2 keys pressed in same col: _list = []
-			_st = _list.pop()
-		else:
-			_st = ''
-		return _st
-
-	''' Decode key to symbol(s) '''
-	if not key:
-		return ''                       # No key pressed: return ''
-	else:
-		symb = []
-		rc0 = key >> 16                 # Get key from col0
-		if rc0:
-			l0 = _2_symbol(key >> 16, COL0)     # Get key from col0
-			symb.append(l0)
-		rc1 = (key >> 8) & 0xF
-		if rc1:
-			l1 = _2_symbol(rc1, COL1)
-			symb.append(l1)
-		rc2 = key & 0xF
-		if rc2:
-			l2 = _2_symbol(rc2, COL2)
-			symb.append(l2)
-	return "".join(symb)
+	Return string: active key's symbols; empty if no key pressed """
 
+	s0 = COL0_SYMB[(key >> 16) & 0xF]   # Get key from col0
+	s1 = COL1_SYMB[(key >> 8) & 0xF]
+	s2 = COL2_SYMB[key & 0xF]
+	if not s1 and not s2:
+		return s0                       # Only col0 (or no key pressed: '')
+	if not s0 and not s2:
+		return s1
+	if not s0 and not s1:
+		return s2
+	t = _chords if _chords is not None else chord_table()
+	return t[COL0_IDX[(key >> 16) & 0xF] + COL1_IDX[(key >> 8) & 0xF] + COL2_IDX[key & 0xF]]
 
-if __name__ == '__main__':
 
-	port_init()                         # Init PortC for keypad
+#################################
+#
+#   Generic N x M matrix keypad
+#
+# Event types; an event is one int in the FIFO:
+#   bits 0–7:   key index (row * nr_cols + col), symbol is keymap[key index]
+#   bits 8–9:   event type
+#   bits 10–29: timestamp, millis() & 0xFFFFF (wraps after ≈17 min)
+EV_PRESS    = const(0)
+EV_RELEASE  = const(1)
+EV_LONG     = const(2)      # Key held for long_ms
+EV_REPEAT   = const(3)      # Auto-repeat every repeat_ms after EV_LONG
+
+KEYMAP_3X4  = '123456789*0#'    # Row by row, as wired to scan_keys (rows C0–C3, columns C4–C6)
+
+
+def event_key(ev):
+	return ev & 0xFF
+
+
+def event_type(ev):
+	return (ev >> 8) & 0x3
+
+
+def event_time(ev):
+	return ev >> 10
+
+
+@micropython.viper
+def scan_port(cfg: ptr32, raw: ptr16, del_cnt: int):
+	""" Scan all columns when rows and columns are on the same GPIO port.
+
+	cfg: [IDR adr, BSRR adr, mask all columns, mask all rows, nr_cols, col0 mask, col1 mask, …]
+	raw: per column, inverted row bits (in port bit positions) of pressed keys
+	One 32 bits write to BSRR sets the other columns high and the active one low """
+	idr = ptr16(cfg[0])
+	bsrr = ptr32(cfg[1])
+	cols = cfg[2]
+	rows = cfg[3]
+	n = cfg[4]
+	bsrr[0] = cols << 16            # All columns low: check if ANY key pressed
+	d = del_cnt
+	while d > 0:
+		d -= 1
+	if ((idr[0] ^ rows) & rows) == 0:
+		c = 0
+		while c < n:
+			raw[c] = 0
+			c += 1
+		return
+	c = 0
+	while c < n:
+		m = cfg[5 + c]
+		bsrr[0] = (cols ^ m) | (m << 16)    # Active column low, others high
+		d = del_cnt
+		while d > 0:
+			d -= 1
+		raw[c] = (idr[0] ^ rows) & rows
+		c += 1
+	bsrr[0] = cols                  # All columns high (released)
+
+
+# Layout of Keypad.kst, array('H') with all state used by the callback:
+#   header (K_*), row masks [nr_rows], then per column: raw, last, state, cnt [nr_cols each], hold [nr_keys]
+K_NC        = const(0)      # nr columns
+K_NR        = const(1)      # nr rows
+K_DEB       = const(2)      # debounce: nr identical scans before a change is accepted
+K_LONG      = const(3)      # nr scans for EV_LONG (0 = off)
+K_REP       = const(4)      # nr scans between EV_REPEAT (0 = off)
+K_HDR       = const(5)      # size of header = offset of row masks
+
+
+class Keypad:
+	""" Scanner for a N x M matrix keypad with debouncing and press/release/long-press/auto-repeat events.
+
+	rows, cols: lists of pin names, e.g. ["C0", "C1", "C2", "C3"], ["C4", "C5", "C6"]
+	keymap:     string (or list) with one symbol per key, row by row
+	freq:       scan rate [Hz] of the timer callback (while keys are active)
+	debounce:   nr of identical scans at freq after a change before it's accepted (or debounce_ms)
+	long_ms, repeat_ms: hold time for EV_LONG and interval for EV_REPEAT (0 = off)
+	idle_freq:  scan rate when no key is active (0 = always freq); switches to freq as soon as a scan
+	            sees a key and back after quiet_ms with all keys released and debounced
+	idle:       True: stop scanning when no key pressed (after quiet_ms if idle_freq), restart on EXTI from a row
+	Debounce, long-press and repeat are kept in ms; the nr of scans is recalculated when the rate changes.
+
+	Scan routine: scan_keys (asm) for the 3 x 4 keypad on GPIOC; scan_port (viper) if all pins are on one port;
+	otherwise Pin objects. Every key is tracked on its own (n-key rollover); the matrix needs diodes to avoid
+	ghost keys when 3 or more keys are pressed.
+	All state used by the callback lives in the object (self.kst and self.buf), not in module globals.
+	Events are read with get() / get_all(), see event_key, event_type and event_time """
+
+	def __init__(self, rows, cols, keymap, freq=100, debounce=3, long_ms=800, repeat_ms=200,
+	             timer=5, buf_size=20, idle=False, idle_freq=0, quiet_ms=1000, debounce_ms=None):
+		self.nr_rows = nr = len(rows)
+		self.nr_cols = nc = len(cols)
+		self.keymap = keymap
+		self.del_cnt = del_cnt_from_freq()     # Settle delay per column; see calibrate()
+		self.prof = None                        # ISRProfiler, see profile()
+		self._tick_cb = self._tick              # Bound once: _row_edge (hard IRQ) can't allocate
+		self.freq = freq
+		self.idle_freq = idle_freq
+		self.debounce_ms = debounce_ms if debounce_ms is not None else (debounce * 1000) // freq
+		self.long_ms = long_ms
+		self.repeat_ms = repeat_ms
+		self.quiet_n = max(1, (quiet_ms * freq) // 1000) if idle_freq else 0   # Nr quiet scans at freq before idle
+		self.quiet_cnt = 0
+		self.fast = True                        # Running at freq (not idle_freq)
+
+		self.o_raw = K_HDR + nr                 # Offsets in kst
+		self.o_last = self.o_raw + nc
+		self.o_state = self.o_last + nc
+		self.o_cnt = self.o_state + nc
+		self.o_hold = self.o_cnt + nc
+		self.kst = array.array('H', [0] * (self.o_hold + nr * nc))
+		self.kst[K_NC] = nc
+		self.kst[K_NR] = nr
+		self.raw = memoryview(self.kst)[self.o_raw:self.o_raw + nc]    # Written by the scan routine
+		self.buf = array.array('i', [0] * (buf_size + 5))
+		self.fifo = FIFO(self.buf)
+
+		self.row_pins = [Pin(r, Pin.IN, Pin.PULL_UP) for r in rows]
+		self.col_pins = [Pin(c, Pin.OUT_OD, Pin.PULL_UP) for c in cols]
+		for p in self.col_pins:
+			p.high()
+
+		''' Select the scan routine '''
+		if list(rows) == ["C0", "C1", "C2", "C3"] and list(cols) == ["C4", "C5", "C6"]:
+			port_init()                             # Also C7 as scan indicator
+			self._scan = self._scan_asm
+			self._spin = asm_spin                   # Delay loop used, for calibrate()
+			row_masks = [1 << p.pin() for p in self.row_pins]
+		elif len(set(p.port() for p in self.row_pins + self.col_pins)) == 1:
+			gpio = self.row_pins[0].gpio()
+			col_masks = [1 << p.pin() for p in self.col_pins]
+			row_masks = [1 << p.pin() for p in self.row_pins]
+			self.cfg = array.array('I', [gpio + stm.GPIO_IDR, gpio + stm.GPIO_BSRRL, sum(col_masks),
+			                             sum(row_masks), nc] + col_masks)
+			self._scan = self._scan_port
+			self._spin = viper_spin
+		else:
+			self._scan = self._scan_pins
+			self._spin = None                       # No delay: Pin objects are slow enough
+			row_masks = [1 << r for r in range(nr)]
+		for i in range(nr):
+			self.kst[K_HDR + i] = row_masks[i]
+
+		self.exti = []
+		if idle:
+			self.exti = [ExtInt(p, ExtInt.IRQ_FALLING, Pin.PULL_UP, self._row_edge) for p in self.row_pins]
+			for e in self.exti:
+				e.disable()                     # Enabled when created; armed by idle_enter() from start()
+		self.tim = Timer(timer, freq=idle_freq if idle_freq else freq)
+		self.set_rate(idle_freq if idle_freq else freq)
+
+	def start(self):
+		if self.exti:
+			self.idle_enter()
+		else:
+			self.tim.callback(self._tick_cb)
+
+	def calibrate(self, margin=2):
+		""" Measure column settle time and set the scan delay accordingly; call with no key pressed """
+		if self._spin:
+			self.del_cnt = settle_del_cnt(self.col_pins, self._spin, margin)
+		for p in self.col_pins:
+			p.high()
+		return self.del_cnt
+
+	def profile(self, prof):
+		""" Record callback duration and jitter in prof (an ISRProfiler from Lib_profiler); None = off """
+		self.prof = prof
+		if prof:
+			prof.set_period(1000000 // self.tim.freq())
+
+	def set_rate(self, f):
+		""" Scan at f Hz; debounce, long-press and repeat (in ms) are converted to nr of scans at f """
+		k = self.kst
+		k[K_DEB] = max(1, (self.debounce_ms * f + 500) // 1000)
+		k[K_LONG] = (self.long_ms * f) // 1000
+		k[K_REP] = max(1, (self.repeat_ms * f) // 1000) if self.repeat_ms else 0
+		self.fast = f == self.freq
+		self.quiet_cnt = 0
+		if self.tim.freq() != f:
+			self.tim.freq(f)
+		if self.prof:
+			self.prof.set_period(1000000 // f)
+
+	def stop(self):
+		self.tim.callback(None)
+		for e in self.exti:
+			e.disable()
+
+	def get(self):
+		""" Get next event; -1 if none """
+		return self.fifo.get(self.buf)
+
+	def get_all(self):
+		return self.fifo.get_all(self.buf)
+
+	def any(self):
+		return self.fifo.nr_unfetched(self.buf)
+
+	def symbol(self, ev):
+		return self.keymap[ev & 0xFF]
+
+	def idle_enter(self):
+		""" Stop scanning, drive all columns low and arm EXTI on the rows. """
+		self.tim.callback(None)
+		self.quiet_cnt = 0
+		for p in self.col_pins:
+			p.low()
+		for e in self.exti:
+			e.enable()
+
+	def _row_edge(self, line):
+		for e in self.exti:
+			e.disable()
+		if not self.fast:
+			self.set_rate(self.freq)
+		self.tim.callback(self._tick_cb)
+
+	def _scan_asm(self):
+		k = scan_keys(self.del_cnt)
+		raw = self.raw
+		raw[0] = k >> 16
+		raw[1] = (k >> 8) & 0xF
+		raw[2] = k & 0xF
+
+	def _scan_port(self):
+		scan_port(self.cfg, self.raw, self.del_cnt)
+
+	def _scan_pins(self):
+		raw = self.raw
+		cols = self.col_pins
+		rows = self.row_pins
+		for c in range(len(cols)):      # range, not enumerate: no allocation in the callback
+			cols[c].low()
+			r = 0
+			for i in range(len(rows)):
+				if not rows[i].value():
+					r |= 1 << i
+			raw[c] = r
+			cols[c].high()
+
+	@micropython.native
+	def _tick(self, tim):
+		""" Callback for Timer: scan, debounce and export events to FIFO """
+		prof = self.prof
+		if prof:
+			prof.enter()
+		self._scan()
+		if self._debounce((millis() & 0xFFFFF) << 10):
+			if self.fast and (self.idle_freq or self.exti):
+				self.quiet_cnt += 1     # All keys released and debounced
+				if self.quiet_cnt > self.quiet_n:
+					if self.exti:
+						self.idle_enter()   # Stop scanning until next edge
+					else:
+						self.set_rate(self.idle_freq)
+		elif self.fast:
+			self.quiet_cnt = 0
+		else:
+			self.set_rate(self.freq)    # Key seen at idle rate
+		if prof:
+			prof.leave()
+
+	@micropython.viper
+	def _debounce(self, now: int) -> int:
+		""" Debounce each column of the last scan and put events in FIFO (put inlined, see Lib_fifo).
+
+		now: timestamp already shifted into place for the event word
+		Returns 1 if all keys are released and debounced """
+		k = ptr16(self.kst)
+		b = ptr32(self.buf)
+		nc = k[K_NC]
+		nr = k[K_NR]
+		deb = k[K_DEB]
+		long_n = k[K_LONG]
+		rep_n = k[K_REP]
+		o_raw = K_HDR + nr
+		o_last = o_raw + nc
+		o_state = o_last + nc
+		o_cnt = o_state + nc
+		o_hold = o_cnt + nc
+
+		quiet = 1
+		c = 0
+		while c < nc:
+			r = k[o_raw + c]
+			changed = 0
+			if r != k[o_last + c]:
+				k[o_last + c] = r       # Changed: wait till next scans and check if stable
+				k[o_cnt + c] = 0
+				quiet = 0
+			elif k[o_cnt + c] < deb:
+				n = k[o_cnt + c] + 1
+				k[o_cnt + c] = n
+				quiet = 0
+				if n == deb:            # Stable: accept
+					changed = r ^ k[o_state + c]
+					k[o_state + c] = r
+			s = k[o_state + c]
+			if s:
+				quiet = 0
+			if changed or (s and long_n):
+				i = 0
+				while i < nr:
+					m = k[K_HDR + i]
+					key = i * nc + c
+					ev = -1
+					if changed & m:
+						if r & m:
+							k[o_hold + key] = 0
+							ev = now | (EV_PRESS << 8) | key
+						else:
+							ev = now | (EV_RELEASE << 8) | key
+					elif (s & m) and long_n:
+						h = k[o_hold + key] + 1
+						if h == long_n:
+							ev = now | (EV_LONG << 8) | key
+						elif rep_n and h == long_n + rep_n:
+							ev = now | (EV_REPEAT << 8) | key
+							h = long_n
+						elif h > long_n + rep_n:
+							h = long_n + 1  # Held, repeat off: stop counting
+						k[o_hold + key] = h
+					if ev != -1:            # FIFO put
+						b[0] = ev
+						if b[3] < b[4] - 5:
+							p = b[1]
+							b[p] = ev
+							p += 1
+							if p >= b[4]:
+								p = 5
+							b[1] = p
+							b[3] = b[3] + 1
+					i += 1
+			c += 1
+		return quiet
 
-	# Todo: why do we sometimes get: 'scan_keys()' not defined? in the callback when Timer 4 or 5 is used ?
-	''' scan_keys: ['9', '9'] 521
-		uncaught exception in Timer(4) interrupt handler
-		NameError: name 'scan_keys' is not defined
-		scan_keys: ['7', '', '9', '5', '6', ''] 1285
-		Traceback (most recent call last):
-		  File "test_keypad.py", line 48, in <module>
-	'''
-	tim = Timer(5, freq=50)             # create a timer object using timer 5 - trigger at 50Hz
-	tim.callback(scan_timer_callback)   # set the callback to keypad-scanner
+if __name__ == '__main__':
 
-	fifo = FIFO(key_buf)                # FIFO-object with global buffer
+	keypad = Keypad(["C0", "C1", "C2", "C3"], ["C4", "C5", "C6"], KEYMAP_3X4, freq=50, idle=True)
+	keypad.start()
 
 	while True:
-		""" Since the consumer probably is slower than scan_keys, short key presses will be missed.
-		Debouncing is done in the callback as well as setting key_flag (status).
-
-		Decoding is done here in the consumer """
-
-		if key_flag == NEW:  # CONSUMER
-			symbol = []
-			if fifo.nr_unfetched(key_buf):
-				start = micros()
-				data = fifo.get_all(key_buf)
-				for i in data:
-					symbol.append(key_to_symbol(i))
-				key_flag = USED         # Acknowledge as taken
-				delta = elapsed_micros(start)
-			print("scan_keys:", symbol, delta)
-
-			if '#' in symbol:
+		""" Debouncing and events are done in the callback; decoding is done here in the consumer """
+		if keypad.any():
+			start = micros()
+			events = keypad.get_all()
+			delta = elapsed_micros(start)
+			symbol = [(keypad.symbol(ev), event_type(ev), event_time(ev)) for ev in events]
+			print("Keypad events:", symbol, delta)
+
+			if [ev for ev in events if keypad.symbol(ev) == '#' and event_type(ev) == EV_RELEASE]:
 				break
 		delay(200)
 
-	tim.callback(None)                  # Stop callback
+	keypad.stop()                       # Stop callback and EXTI
 	print()
@@ -0,0 +1,81 @@
+"""Line input from the keypad, echoed on the LCD of the HA7S 1-wire display one cell at a time."""
+__author__ = 'folke'
+
+from Lib_keypad import EV_PRESS, EV_REPEAT, event_type
+
+
+class LineInput:
+	""" Edit a line of digits with the keypad: '0'–'9' insert at cursor, '*' erases the last one, '#' ends input.
+
+	keypad:     Lib_keypad.Keypad (started)
+	one_w, lcd_rom: Lib_HA7S.HA7S and rom code of the LCD
+	row, col, width: where on the LCD the line is (width defaults to rest of row)
+	Each keystroke writes only the changed LCD cell (HA7S.lcd_put_char); typing at the end of the line
+	doesn't even set the LCD adr, since the LCD steps its adr counter after each char.
+	Holding a digit or '*' repeats it (EV_REPEAT); '#' only acts on the press, so holding it returns the line once.
+	Call poll() in the main loop; returns the line when '#' is pressed, else None. clear() starts a new line """
+
+	def __init__(self, keypad, one_w, lcd_rom, row, col=0, width=None, erase='*', enter='#'):
+		self.keypad = keypad
+		self.one_w = one_w
+		self.lcd_rom = lcd_rom
+		self.row = row
+		self.col = col
+		self.width = width if width else one_w.ROW_LENGTH - col
+		self.erase = erase
+		self.enter = enter
+		self.line = bytearray(self.width)
+		self.cursor = 0
+
+	def clear(self):
+		""" Erase shown text and start a new line; left to right, so the LCD adr is set only once """
+		for i in range(self.cursor):
+			self.one_w.lcd_put_char(self.lcd_rom, self.row, self.col + i, ' ')
+		self.cursor = 0
+
+	def poll(self):
+		""" Handle all key events waiting in the keypad FIFO """
+		while self.keypad.any():
+			ev = self.keypad.get()
+			t = event_type(ev)
+			if t != EV_PRESS and t != EV_REPEAT:
+				continue
+			s = self.keypad.symbol(ev)
+			if s == self.enter:
+				if t == EV_PRESS:
+					return str(self.line[:self.cursor], 'ascii')
+			elif s == self.erase:
+				if self.cursor:
+					self._erase()
+			elif self.cursor < self.width:
+				self.line[self.cursor] = ord(s)
+				self.one_w.lcd_put_char(self.lcd_rom, self.row, self.col + self.cursor, s)
+				self.cursor += 1
+		return None
+
+	def _erase(self):
+		self.cursor -= 1
+		self.one_w.lcd_put_char(self.lcd_rom, self.row, self.col + self.cursor, ' ')
+
+
+if __name__ == '__main__':
+	from Lib_keypad import Keypad, KEYMAP_3X4
+	from Lib_HA7S import HA7S
+	from pyb import delay
+
+	lcd_rom = b'68000100000903FF'
+	one_w = HA7S(4)
+	one_w.print_on_lcd(lcd_rom, "Kod:", 0, clear_LCD=True)
+	keypad = Keypad(["C0", "C1", "C2", "C3"], ["C4", "C5", "C6"], KEYMAP_3X4, freq=100, idle=True)
+	keypad.start()
+
+	inp = LineInput(keypad, one_w, lcd_rom, 0, 5)
+	while True:
+		line = inp.poll()
+		if line is not None:
+			print("Line:", line)
+			if not line:
+				break               # Empty line ends
+			inp.clear()
+		delay(10)
+	keypad.stop()
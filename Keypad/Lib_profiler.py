@@ -0,0 +1,83 @@
+"""Profiler for timer callbacks (ISR): histograms of duration and jitter, measured with ticks_cpu.
+
+No allocation in enter() / leave(), so they can be called from the callback itself."""
+__author__ = 'folke'
+
+from utime import ticks_cpu, ticks_diff
+import machine
+import array
+
+
+class ISRProfiler:
+	""" Records duration of each callback and jitter (|interval between calls - period|) in fixed histograms.
+
+	period_us:  nominal interval between calls (1e6 / timer freq)
+	bin_us:     width of each histogram bin; last bin also counts everything above
+	Usage in the callback: prof.enter() first, prof.leave() last; print with report() """
+
+	def __init__(self, period_us, bin_us=2, nr_bins=32):
+		self.cyc_us = machine.freq()[0] // 1000000      # ticks_cpu counts CPU cycles
+		self.bin_us = bin_us
+		self.bin_cyc = bin_us * self.cyc_us
+		self.nr_bins = nr_bins
+		self.dur = array.array('I', [0] * nr_bins)
+		self.jit = array.array('I', [0] * nr_bins)
+		''' st: [start of last call (0: skip next jitter), period, max duration, max jitter, nr calls,
+		start of this call, new period (0: none)] (cycles) '''
+		self.st = array.array('i', [0] * 7)
+		self.set_period(period_us)
+
+	def set_period(self, period_us):
+		""" New nominal period, e.g. when the timer changes frequency; next interval is not counted.
+		Applied by the next enter(), so it may be called from the callback (between enter and leave) """
+		self.st[6] = period_us * self.cyc_us
+
+	def clear(self):
+		for i in range(self.nr_bins):
+			self.dur[i] = 0
+			self.jit[i] = 0
+		for i in (0, 2, 3, 4):
+			self.st[i] = 0
+
+	@micropython.native
+	def enter(self):
+		t = ticks_cpu()
+		st = self.st
+		if st[6]:                       # New period: interval since last call is not counted
+			st[1] = st[6]
+			st[6] = 0
+			st[0] = 0
+		if st[0]:
+			j = ticks_diff(t, st[0]) - st[1]
+			if j < 0:
+				j = -j
+			if j < 2 * st[1]:           # Not first call after a pause (idle or new period)
+				if j > st[3]:
+					st[3] = j
+				b = j // self.bin_cyc
+				if b >= self.nr_bins:
+					b = self.nr_bins - 1
+				self.jit[b] += 1
+		st[0] = t | 1                   # Never 0 (0 = no previous call)
+		st[5] = t
+
+	@micropython.native
+	def leave(self):
+		st = self.st
+		d = ticks_diff(ticks_cpu(), st[5])
+		if d > st[2]:
+			st[2] = d
+		b = d // self.bin_cyc
+		if b >= self.nr_bins:
+			b = self.nr_bins - 1
+		self.dur[b] += 1
+		st[4] += 1
+
+	def report(self):
+		print("Calls: %d  max duration: %.1f µs  max jitter: %.1f µs" %
+		      (self.st[4], self.st[2] / self.cyc_us, self.st[3] / self.cyc_us))
+		print("   µs  duration    jitter")
+		for i in range(self.nr_bins):
+			if self.dur[i] or self.jit[i]:
+				more = '+' if i == self.nr_bins - 1 else ' '
+				print("%5d%s %8d  %8d" % (i * self.bin_us, more, self.dur[i], self.jit[i]))
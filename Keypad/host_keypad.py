@@ -0,0 +1,321 @@
+"""Host side (CPython) model of the keypad and replay benchmark for debounce and decode.
+
+Runs Lib_keypad off-board: install() puts shims for pyb, stm, machine, utime and the micropython
+decorators in place, scan_keys is replaced by KeyMatrix.scan_keys (same 3 x 8 bits packed output) and
+the Timer callback (Keypad._tick) is called once per tick of a recorded or synthetic bounce trace.
+
+	python3 host_keypad.py [trace file] [--freq 100] [--debounce 3] [--bounce 4] [--seed 1] [--idle 1] [--idle-freq 20]
+	                        [--quiet-ms 1000] [--gap 20]
+
+--gap: ticks between synthetic key presses; default 20, or with --idle-freq 50 ticks more than quiet_ms
+so the timer really drops to the idle rate between keys.
+Trace file: one packed scan_keys code per line (hex, e.g. 0x000200); '#' starts a comment.
+Exits with 1 if any key press/release was missed or duplicated (synthetic traces only).
+"""
+__author__ = 'folke'
+
+import builtins
+import random
+import sys
+import time
+import types
+
+ROWS_3X4 = ["C0", "C1", "C2", "C3"]
+COLS_3X4 = ["C4", "C5", "C6"]
+
+
+#################################
+#
+#   Shims for MicroPython modules
+#
+class Pin:
+	""" pyb.Pin: only what Lib_keypad uses; value() of an input is always 1 (released) """
+	IN = 0
+	OUT_PP = 1
+	OUT_OD = 2
+	PULL_UP = 1
+
+	def __init__(self, name, mode=IN, pull=None):
+		self.name = name
+		self.level = 1
+
+	def high(self):
+		self.level = 1
+
+	def low(self):
+		self.level = 0
+
+	def value(self):
+		return self.level
+
+	def pin(self):
+		return int(self.name[1:])
+
+	def port(self):
+		return ord(self.name[0]) - ord('A')
+
+	def gpio(self):
+		return 0x40020000 + 0x400 * self.port()
+
+
+class ExtInt:
+	IRQ_FALLING = 0
+
+	def __init__(self, pin, mode, pull, callback):
+		self.callback = callback
+		self.enabled = True
+
+	def enable(self):
+		self.enabled = True
+
+	def disable(self):
+		self.enabled = False
+
+
+class Timer:
+	""" pyb.Timer: the callback is only called by Replay (or anyone calling fire()) """
+
+	def __init__(self, nr, freq=None):
+		self.nr = nr
+		self.f = freq
+		self.cb = None
+
+	def callback(self, cb):
+		self.cb = cb
+
+	def freq(self, f=None):
+		if f is None:
+			return self.f
+		self.f = f
+
+	def fire(self):
+		if self.cb:
+			self.cb(self)
+
+
+class Clock:
+	""" Virtual millis(); advanced by Replay, one scan period per tick """
+	ms = 0
+
+
+def install():
+	""" Make Lib_keypad and Lib_fifo importable with CPython """
+	if 'pyb' in sys.modules:
+		return
+
+	mp = types.ModuleType('micropython')
+	mp.native = mp.viper = mp.asm_thumb = lambda f: f
+	mp.const = lambda x: x
+	builtins.micropython = mp
+	builtins.const = mp.const
+	builtins.ptr8 = builtins.ptr16 = builtins.ptr32 = lambda buf: buf     # Viper code only indexes buffers
+	sys.modules['micropython'] = mp
+
+	stm = types.ModuleType('stm')
+	stm.GPIOC = 0x40020800
+	stm.GPIO_IDR = 0x10
+	stm.GPIO_BSRRL = 0x18
+	stm.GPIO_BSRRH = 0x1A
+	sys.modules['stm'] = stm
+
+	pyb = types.ModuleType('pyb')
+	pyb.Pin = Pin
+	pyb.ExtInt = ExtInt
+	pyb.Timer = Timer
+	pyb.millis = lambda: Clock.ms
+	pyb.micros = lambda: time.perf_counter_ns() // 1000
+	pyb.elapsed_micros = lambda start: time.perf_counter_ns() // 1000 - start
+	pyb.delay = lambda ms: None
+	pyb.disable_irq = lambda: 0
+	pyb.enable_irq = lambda state=0: None
+	sys.modules['pyb'] = pyb
+
+	machine = types.ModuleType('machine')
+	machine.freq = lambda: (168000000, 168000000, 42000000, 84000000)
+	sys.modules['machine'] = machine
+
+	utime = types.ModuleType('utime')
+	utime.ticks_cpu = lambda: time.perf_counter_ns() * 168 // 1000
+	utime.ticks_diff = lambda a, b: a - b
+	sys.modules['utime'] = utime
+
+
+#################################
+#
+#   Reference model of the 3 x 4 keypad
+#
+class KeyMatrix:
+	""" Model of the keypad as seen by scan_keys: pressed keys as (row, col), output packed as in scan_keys.
+
+	col0 in bits 16–19, col1 in bits 8–11 and col2 in bits 0–3; bit r set = key in row r pressed """
+
+	def __init__(self, keymap='123456789*0#', nr_cols=3):
+		self.keymap = keymap
+		self.nr_cols = nr_cols
+		self.code = 0                   # Packed output of next scan
+
+	def key_code(self, symbol):
+		""" Packed code for one key pressed """
+		i = self.keymap.index(symbol)
+		r, c = divmod(i, self.nr_cols)
+		return (1 << r) << (8 * (self.nr_cols - 1 - c))
+
+	def scan_keys(self, del_cnt=0):
+		return self.code
+
+
+def bounce_trace(symbols, hold=20, gap=20, bounce=4, seed=1, keymap='123456789*0#'):
+	""" Synthetic trace: each symbol is pressed for ≈hold ticks with gap ticks in between.
+
+	For bounce ticks after each press and release the contact toggles randomly.
+	Returns (codes, truth); truth: list of (symbol, tick of press edge, tick of release edge) """
+	rnd = random.Random(seed)
+	model = KeyMatrix(keymap)
+	codes = [0] * gap
+	truth = []
+	for s in symbols:
+		k = model.key_code(s)
+		t_press = len(codes)
+		h = hold + rnd.randint(0, hold // 2)
+		codes += [k if (i >= bounce or rnd.random() < 0.5) else 0 for i in range(h)]
+		codes[t_press] = k              # Edge starts with contact
+		t_release = len(codes)
+		codes += [0 if (i >= bounce or rnd.random() < 0.5) else k for i in range(gap)]
+		codes[t_release] = 0
+		truth.append((s, t_press, t_release))
+	return codes, truth
+
+
+def load_trace(path):
+	""" Recorded trace: one packed scan_keys code per line """
+	codes = []
+	with open(path) as f:
+		for line in f:
+			line = line.split('#')[0].strip()
+			if line:
+				codes.append(int(line, 0))
+	return codes
+
+
+#################################
+#
+#   Replay harness
+#
+class Replay:
+	""" Feeds a trace through Keypad's callback (scan + debounce); one trace entry per tick at freq.
+
+	With idle_freq the timer runs slower while no key is active, then only every n:th entry is scanned.
+	Events are fetched from the FIFO after every tick, so the tick they appeared in is known """
+
+	def __init__(self, freq=100, debounce=3, long_ms=0, repeat_ms=0, idle=False, idle_freq=0, quiet_ms=1000):
+		install()
+		import Lib_keypad
+		self.lib = Lib_keypad
+		self.model = KeyMatrix(Lib_keypad.KEYMAP_3X4)
+		Lib_keypad.scan_keys = self.model.scan_keys     # Used by Keypad._scan_asm
+		self.period_ms = 1000 // freq
+		self.keypad = Lib_keypad.Keypad(ROWS_3X4, COLS_3X4, Lib_keypad.KEYMAP_3X4, freq=freq,
+		                                debounce=debounce, long_ms=long_ms, repeat_ms=repeat_ms, idle=idle,
+		                                idle_freq=idle_freq, quiet_ms=quiet_ms)
+		self.callbacks = 0              # Nr of ticks the callback ran (< nr ticks in idle mode)
+
+	def run(self, codes):
+		""" Returns list of (tick, symbol, event type) """
+		kp = self.keypad
+		kp.start()
+		events = []
+		next_ms = Clock.ms
+		for tick, code in enumerate(codes):
+			self.model.code = code
+			Clock.ms += self.period_ms
+			if kp.tim.cb is None and code:
+				for e in kp.exti:       # Idle: a pressed key pulls its row low
+					if e.enabled:
+						e.callback(0)
+						break
+			if kp.tim.cb and Clock.ms >= next_ms:
+				self.callbacks += 1
+				kp.tim.fire()
+				next_ms = Clock.ms + 1000 // kp.tim.freq()
+			while kp.any():
+				ev = kp.get()
+				events.append((tick, kp.symbol(ev), self.lib.event_type(ev)))
+		kp.stop()
+		return events
+
+	def check(self, events, truth):
+		""" Match events with truth: returns (missed, duplicated, latencies [ticks]) """
+		missed = 0
+		duplicated = 0
+		latency = []
+		for ev_type, edge in ((self.lib.EV_PRESS, 1), (self.lib.EV_RELEASE, 2)):
+			got = [(t, s) for (t, s, e) in events if e == ev_type]
+			matched = 0
+			for i, item in enumerate(truth):
+				start = item[edge]
+				end = truth[i + 1][edge] if i + 1 < len(truth) else 1 << 30
+				hits = [t for (t, s) in got if s == item[0] and start <= t < end]
+				matched += len(hits)
+				if not hits:
+					missed += 1
+				else:
+					duplicated += len(hits) - 1
+					latency.append(hits[0] - start)
+			duplicated += len(got) - matched    # Events for keys not pressed at all
+		return missed, duplicated, latency
+
+
+def decode_rate(codes, n=20000):
+	""" key_to_symbol calls per second over the codes of the trace """
+	import Lib_keypad
+	key_to_symbol = Lib_keypad.key_to_symbol
+	codes = (codes * (n // max(1, len(codes)) + 1))[:n]
+	t = time.perf_counter()
+	for c in codes:
+		key_to_symbol(c)
+	return n / (time.perf_counter() - t)
+
+
+def main(argv):
+	opts = {'--freq': 100, '--debounce': 3, '--bounce': 4, '--seed': 1, '--idle': 0, '--idle-freq': 0,
+	        '--quiet-ms': 1000, '--gap': 0}
+	path = None
+	args = list(argv)
+	while args:
+		a = args.pop(0)
+		if a in opts:
+			opts[a] = int(args.pop(0))
+		else:
+			path = a
+
+	replay = Replay(opts['--freq'], opts['--debounce'], idle=bool(opts['--idle']), idle_freq=opts['--idle-freq'],
+	                quiet_ms=opts['--quiet-ms'])
+	gap = opts['--gap']
+	if not gap:
+		gap = (opts['--quiet-ms'] * opts['--freq']) // 1000 + 50 if opts['--idle-freq'] else 20
+	if path:
+		codes, truth = load_trace(path), None
+	else:
+		codes, truth = bounce_trace('1234567890*#' * 4, gap=gap, bounce=opts['--bounce'], seed=opts['--seed'])
+
+	t = time.perf_counter()
+	events = replay.run(codes)
+	dt = time.perf_counter() - t
+	print("Ticks: %d  callbacks: %d  events: %d  callbacks/s: %.0f" %
+	      (len(codes), replay.callbacks, len(events), replay.callbacks / dt))
+	print("key_to_symbol decodes/s: %.0f" % decode_rate(codes))
+
+	if truth is None:
+		for e in events:
+			print(e)
+		return 0
+	missed, duplicated, latency = replay.check(events, truth)
+	print("Key edges: %d  missed: %d  duplicated: %d" % (2 * len(truth), missed, duplicated))
+	if latency:
+		print("Latency [ticks]: min %d  mean %.1f  max %d" %
+		      (min(latency), sum(latency) / len(latency), max(latency)))
+	return 1 if missed or duplicated else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
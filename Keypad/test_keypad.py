@@ -1,60 +1,45 @@
 """ Test of Lib_keypad """
 
-from Lib_keypad import port_init, scan_timer_callback, scan_keys, key_to_symbol
-from pyb import Timer, delay, micros, elapsed_micros
-from Lib_fifo import FIFO
-import array
+from Lib_keypad import Keypad, KEYMAP_3X4, event_type, event_time, EV_RELEASE, del_cnt_from_freq
+from Lib_profiler import ISRProfiler
+from pyb import delay, micros, elapsed_micros
 
 
-# Globals for communication with timer callback routine
-key_last = 0
-key_old = 0
-key_flag = 0
-key_buf = array.array('i', [0] * 25)  # Room for 20 key presses/releases
-
-# Constants
-NONE = 0  # No key pressed
-NEW = 3  # key_flag = 3 means it's debounced and New
-USED = 4  # key_flag = 4 means consumer has received symbol (Not New anymore)
+EV_NAME = ('press', 'release', 'long', 'repeat')
 
 if __name__ == '__main__':
 
-	port_init()  # Init PortC for keypad
+	keypad = Keypad(["C0", "C1", "C2", "C3"], ["C4", "C5", "C6"], KEYMAP_3X4, freq=100, idle_freq=20)   # Timer 5 @100 Hz, 20 Hz when idle
 
-	tim = Timer(5, freq=100)            # create a timer object using timer 5 - trigger at 50Hz
-	tim.callback(scan_timer_callback)   # set the callback to keypad-scanner
+	''' Time the callback (scan + debounce) before starting the timer '''
+	start = micros()
+	for _ in range(1000):
+		keypad._tick(None)
+	print("Callback [no key]: %5.1f µs" % (elapsed_micros(start) / 1000))
 
-	# Todo: why do we sometimes get: 'scan_keys()' not defined? in the callback when Timer 4 or 5 is used ?
-	''' scan_keys: ['9', '9'] 521
-		uncaught exception in Timer(4) interrupt handler
-		NameError: name 'scan_keys' is not defined
-		scan_keys: ['7', '', '9', '5', '6', ''] 1285
-		Traceback (most recent call last):
-		  File "test_keypad.py", line 48, in <module>
-	'''
+	print("Scan delay: %d (from freq: %d)" % (keypad.calibrate(), del_cnt_from_freq()))   # No key pressed!
 
-	fifo = FIFO(key_buf)  # FIFO-object with global buffer
+	prof = ISRProfiler(10000)           # Period 10 ms @100 Hz
+	keypad.profile(prof)
+	keypad.start()                      # set the callback to keypad-scanner
 
 	while True:
-		""" Since the consumer probably is slower than scan_keys, short key presses will be missed.
-		Debouncing is done in the callback as well as setting key_flag (status).
+		""" Since the consumer probably is slower than the scanner, events are queued in the FIFO.
+		Debouncing and time stamping is done in the callback.
 
 		Decoding is done here in the consumer """
 
-		if key_flag == NEW:  # CONSUMER
-			symbol = []
-			if fifo.nr_unfetched(key_buf):  # Unfetched data available ?
-				start = micros()
-				data = fifo.get_all(key_buf)  # Get all as a tuple
-				for d in data:
-					symbol.append(key_to_symbol(d))
-				key_flag = USED  # Acknowledge as taken
-				delta = elapsed_micros(start)
-			print("scan_keys:", symbol, delta)
-
-			if '#' in symbol:
+		if keypad.any():  # CONSUMER
+			start = micros()
+			data = keypad.get_all()  # Get all as a tuple
+			symbol = [(keypad.symbol(ev), EV_NAME[event_type(ev)], event_time(ev)) for ev in data]
+			delta = elapsed_micros(start)
+			print("Keypad:", symbol, delta)
+
+			if [ev for ev in data if keypad.symbol(ev) == '#' and event_type(ev) == EV_RELEASE]:
 				break
 		delay(200)
 
-	tim.callback(None)  # Stop callback
+	keypad.stop()  # Stop callback
+	prof.report()
 	print()
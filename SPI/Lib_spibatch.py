@@ -0,0 +1,115 @@
+"""Coalescing SPI writer for TFT-style devices with CS and DC (command/data) pins.
+
+Many small spi.send calls (e.g. 4 bytes each) are much slower than one long send, and pathologically slow
+at some baudrates (see Tests/test_SPI.py). SPIBatch collects the small writes in a preallocated buffer and
+sends one transfer per run of bytes with the same DC level. Data-only bursts become one long transfer; for
+command + data traffic (DC toggles every few bytes) the transfer count stays the same, only CS is held low."""
+__author__ = 'folke'
+
+import array
+
+
+class SPIBatch:
+	""" Batching writer: write_cmd / write_data / command are buffered and sent by flush().
+
+	spi:    a pyb.SPI (already initialised) or anything with send(buf) and recv(n)
+	cs, dc: Pin objects; CS active low; DC low = command byte(s), high = data
+	size:   buffer size [bytes]; writes larger than the buffer are sent directly
+	max_segs: nr of DC changes buffered before flush
+
+	Flush happens when the buffer (or segment list) is full, on flush() and before read().
+	CS is held low during the whole flush. Bytes are kept in segments of the same DC level; since a new
+	segment starts only when DC changes, levels alternate and only the level of the first is stored.
+	send() is write_data(), so code that calls spi.send(data) can use an SPIBatch instead """
+
+	def __init__(self, spi, cs, dc, size=1024, max_segs=64):
+		self.spi = spi
+		self.cs = cs
+		self.dc = dc
+		self.size = size
+		self.buf = bytearray(size)
+		self.mv = memoryview(self.buf)
+		self.n = 0                      # Nr of bytes buffered
+		self.ends = array.array('H', [0] * max_segs)    # End of each segment, but the last (= n)
+		self.nr_segs = 0                # Nr of entries in ends
+		self.first_dc = 1               # DC level of first segment
+		self.last_dc = 1                # DC level of last segment
+		cs.high()
+
+	def write_cmd(self, cmd):
+		""" Buffer one command byte (DC low) """
+		if self.n >= self.size or (self.n and self.last_dc and self.nr_segs >= len(self.ends)):
+			self.flush()
+		self._level(0)
+		self.buf[self.n] = cmd
+		self.n += 1
+
+	def write_data(self, data):
+		""" Buffer data bytes (DC high) """
+		l = len(data)
+		if l > self.size - self.n or (self.n and not self.last_dc and self.nr_segs >= len(self.ends)):
+			self.flush()
+			if l > self.size:
+				self._send(1, data)     # Too big for buffer: send as is
+				return
+		self._level(1)
+		n = self.n
+		self.buf[n:n + l] = data
+		self.n = n + l
+
+	send = write_data
+
+	def command(self, cmd, data=None):
+		""" Command byte followed by its (optional) data bytes; kept in the same flush if they fit """
+		l = len(data) if data else 0
+		if self.n + 1 + l > self.size or self.nr_segs + 2 > len(self.ends):
+			self.flush()
+		self.write_cmd(cmd)
+		if data:
+			self.write_data(data)
+
+	def flush(self):
+		""" Send all buffered bytes, one transfer per segment, with CS low during all of them """
+		if not self.n:
+			return
+		self.cs.low()
+		dc = self.first_dc
+		start = 0
+		for i in range(self.nr_segs):
+			end = self.ends[i]
+			self.dc.value(dc)
+			self.spi.send(self.mv[start:end])
+			start = end
+			dc ^= 1
+		self.dc.value(dc)
+		self.spi.send(self.mv[start:self.n])
+		self.cs.high()
+		self.n = 0
+		self.nr_segs = 0
+
+	def read(self, nr_bytes, cmd=None):
+		""" Flush, then (send cmd and) read nr_bytes """
+		self.flush()
+		self.cs.low()
+		if cmd is not None:
+			self.dc.low()
+			self.spi.send(cmd)
+		self.dc.high()
+		data = self.spi.recv(nr_bytes)
+		self.cs.high()
+		return data
+
+	def _level(self, dc):
+		""" Start a new segment if DC changes """
+		if not self.n:
+			self.first_dc = dc
+		elif dc != self.last_dc:
+			self.ends[self.nr_segs] = self.n
+			self.nr_segs += 1
+		self.last_dc = dc
+
+	def _send(self, dc, data):
+		self.dc.value(dc)
+		self.cs.low()
+		self.spi.send(data)
+		self.cs.high()
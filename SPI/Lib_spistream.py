@@ -0,0 +1,124 @@
+"""Double (or more) buffered SPI streaming: one buffer is sent in the background while the next is filled.
+
+pyb.SPI.send blocks the caller for the whole transfer, so the transfers are done by a worker thread
+(_thread). On a PC the same code runs with CPython threads. Without _thread the buffers are sent when
+submitted (blocking) and the completion callback is called directly, so the calling code is the same.
+
+N.B. stock pyboard firmware (PYBV10/PYBV11) is built without _thread: there is no overlap then, only the
+blocking fallback. stream.running tells which one is used (False: no _thread: blocking fallback)."""
+__author__ = 'folke'
+
+import array
+
+try:
+	import _thread
+except ImportError:
+	_thread = None
+
+
+class SPIStream:
+	""" Streaming writer with nr_bufs preallocated buffers of size bytes, used in turn.
+
+	Either fill buffers yourself:
+		buf = stream.get_buffer()           # Waits until the buffer has been sent (if in use)
+		…fill buf[0:n]…
+		stream.submit(n)
+	or copy data with write(data) and flush().
+	wait() returns when all submitted buffers are sent; close() also stops the worker.
+	on_done(n) is called (from the worker) after each buffer of n bytes is sent.
+
+	Per buffer two locks, released by the other thread: full (locked until submitted) and
+	empty (locked while filled or in flight) """
+
+	def __init__(self, spi, nr_bufs=2, size=1024, on_done=None):
+		self.spi = spi
+		self.size = size
+		self.on_done = on_done
+		self.bufs = [bytearray(size) for _ in range(nr_bufs)]
+		self.mvs = [memoryview(b) for b in self.bufs]
+		self.lens = array.array('H', [0] * nr_bufs)
+		self.nr_bufs = nr_bufs
+		self.fill = 0                   # Buffer the application fills next
+		self.n = 0                      # Bytes in current buffer (write)
+		self.got = False                # Current buffer acquired (get_buffer)
+		self.running = _thread is not None  # Worker thread; False: no _thread, blocking fallback
+		if self.running:
+			self.full = [_thread.allocate_lock() for _ in range(nr_bufs)]
+			self.empty = [_thread.allocate_lock() for _ in range(nr_bufs)]
+			for l in self.full:
+				l.acquire()
+			_thread.start_new_thread(self._run, ())
+
+	def get_buffer(self):
+		""" Current buffer to fill (bytearray of size bytes); waits until it's free """
+		if not self.got:
+			if self.running:
+				self.empty[self.fill].acquire()
+			self.got = True
+		return self.bufs[self.fill]
+
+	def submit(self, nr_bytes):
+		""" Send first nr_bytes of current buffer in the background and move to next buffer """
+		self.get_buffer()
+		k = self.fill
+		self.lens[k] = nr_bytes
+		self.fill = (k + 1) % self.nr_bufs
+		self.got = False
+		self.n = 0
+		if self.running:
+			self.full[k].release()      # Worker may start
+		else:
+			self._send(k)
+
+	def write(self, data):
+		""" Copy data into buffers; full buffers are submitted """
+		i = 0
+		l = len(data)
+		while i < l:
+			buf = self.get_buffer()
+			m = min(l - i, self.size - self.n)
+			buf[self.n:self.n + m] = data[i:i + m]
+			self.n += m
+			i += m
+			if self.n == self.size:
+				self.submit(self.n)
+
+	def flush(self):
+		""" Submit partly filled buffer (from write) """
+		if self.n:
+			self.submit(self.n)
+
+	def wait(self):
+		""" Wait until all submitted buffers are sent """
+		if self.running:
+			for k in range(self.nr_bufs):
+				if not (self.got and k == self.fill):
+					self.empty[k].acquire()
+					self.empty[k].release()
+
+	def close(self):
+		""" Flush, wait and stop worker """
+		self.flush()
+		self.wait()
+		if self.running:
+			self.running = False
+			self.get_buffer()
+			self.lens[self.fill] = 0    # Stop marker
+			self.full[self.fill].release()
+
+	def _send(self, k):
+		n = self.lens[k]
+		self.spi.send(self.mvs[k][:n])
+		if self.on_done:
+			self.on_done(n)
+
+	def _run(self):
+		""" Worker: send buffers in the order they are submitted """
+		k = 0
+		while True:
+			self.full[k].acquire()      # Wait for submit
+			if not self.running and not self.lens[k]:
+				break
+			self._send(k)
+			self.empty[k].release()     # Buffer free for the application again
+			k = (k + 1) % self.nr_bufs
@@ -0,0 +1,188 @@
+"""Benchmark of SPI throughput for different burst sizes and baudrates, with statistics.
+
+Each case (baud rate, burst size) sends `total` bytes as total // size bursts from ONE preallocated buffer,
+so only the SPI path is timed, and is repeated `reps` times. Reported: min / median / p95 of the time for
+all bursts, µs per burst and effective bytes/s. Results can be written as CSV or JSON and compared
+with a saved JSON baseline to flag regressions.
+
+On the pyboard (from the REPL):
+	import bench_SPI
+	res = bench_SPI.run(bus=2, sizes=[1, 4, 16], reps=5)
+	bench_SPI.save_json(res, 'spi_base.json')
+
+On a PC there is no pyb, so a FakeSPI modelling transfer time is used:
+	python3 bench_SPI.py [--bus 2] [--sizes 1,4,16] [--bauds 328125,...] [--reps 5] [--total 8192]
+	                     [--csv out.csv] [--json out.json] [--baseline base.json] [--tolerance 0.1]
+Exits with 1 if a regression against the baseline was found.
+"""
+
+import sys
+
+try:
+	from pyb import SPI, Pin, micros, elapsed_micros
+	ON_BOARD = True
+except ImportError:
+	import time
+	ON_BOARD = False
+
+	def micros():
+		return time.perf_counter_ns() // 1000
+
+	def elapsed_micros(start):
+		return micros() - start
+
+try:
+	import ujson as json
+except ImportError:
+	import json
+
+
+BAUD_RATES = [328125, 656250, 1312500, 2625000, 5250000, 10500000, 21000000]
+SIZES = list(range(1, 17))
+SLOW_US = 500               # µs per burst to flag as "SLOW !" (as in test_SPI.py)
+FIELDS = ('baud', 'size', 'bursts', 'reps', 'min_us', 'median_us', 'p95_us', 'us_per_burst', 'bytes_per_s')
+
+
+class FakeSPI:
+	""" Stand-in for pyb.SPI on a PC: send() busy-waits for the time the transfer would take.
+
+	overhead_us: fixed cost per call (setup, DMA start) """
+	MASTER = 0
+
+	def __init__(self, bus, mode=MASTER, baudrate=328125, overhead_us=10):
+		self.overhead_us = overhead_us
+		self.init(mode, baudrate)
+
+	def init(self, mode, baudrate=328125):
+		self.baud = baudrate
+
+	def send(self, buf):
+		end = micros() + self.overhead_us + len(buf) * 8 * 1000000 // self.baud
+		while micros() < end:
+			pass
+
+
+def open_spi(bus, baud):
+	if ON_BOARD:
+		spi = SPI(bus, SPI.MASTER, baud)
+		if bus == 2:
+			''' Since MISO is not connected, disable SPI for MISO by setting Pin as normal Pin input '''
+			Pin('Y7', Pin.IN)
+		return spi
+	return FakeSPI(bus, FakeSPI.MASTER, baud)
+
+
+def stats(times):
+	""" (min, median, p95) of list of times """
+	t = sorted(times)
+	n = len(t)
+	median = t[n // 2] if n % 2 else (t[n // 2 - 1] + t[n // 2]) / 2
+	p95 = t[min(n - 1, (95 * n + 99) // 100 - 1)]       # Nearest rank
+	return t[0], median, p95
+
+
+def run_case(spi, baud, size, total=8192, reps=5):
+	""" Time total // size bursts of size bytes, reps times; returns dict with FIELDS """
+	spi.init(spi.MASTER, baud)                  # Change baud rate
+	buf = bytearray(size)
+	for i in range(size):
+		buf[i] = i & 0xFF
+	bursts = max(1, total // size)
+	times = []
+	for _ in range(reps):
+		start = micros()
+		for _ in range(bursts):
+			spi.send(buf)
+		times.append(elapsed_micros(start))
+	t_min, t_med, t_p95 = stats(times)
+	return {'baud': baud, 'size': size, 'bursts': bursts, 'reps': reps,
+	        'min_us': t_min, 'median_us': t_med, 'p95_us': t_p95,
+	        'us_per_burst': t_med / bursts, 'bytes_per_s': bursts * size * 1000000 / max(1, t_med)}
+
+
+def run(bus=2, sizes=SIZES, bauds=BAUD_RATES, reps=5, total=8192, spi=None, verbose=True):
+	""" Run all cases; returns list of result dicts """
+	if spi is None:
+		spi = open_spi(bus, bauds[0])
+	results = []
+	for size in sizes:
+		if verbose:
+			print("\nBursts of %2d bytes (%d bursts, %d reps):" % (size, max(1, total // size), reps))
+		for baud in bauds:
+			r = run_case(spi, baud, size, total, reps)
+			results.append(r)
+			if verbose:
+				print_result(r)
+	return results
+
+
+def print_result(r):
+	nb = 'SLOW !' if r['bursts'] > 1 and r['us_per_burst'] > SLOW_US else ''
+	print("%6s %7.3f Mbaud  min/median/p95:%8.3f%8.3f%8.3f ms %7.1f us/burst %9.0f B/s" %
+	      (nb, r['baud'] / 1e6, r['min_us'] / 1e3, r['median_us'] / 1e3, r['p95_us'] / 1e3,
+	       r['us_per_burst'], r['bytes_per_s']))
+
+
+def save_csv(results, path):
+	with open(path, 'w') as f:
+		f.write(','.join(FIELDS) + '\n')
+		for r in results:
+			f.write(','.join(str(r[k]) for k in FIELDS) + '\n')
+
+
+def save_json(results, path):
+	with open(path, 'w') as f:
+		f.write(json.dumps(results))
+
+
+def load_json(path):
+	with open(path) as f:
+		return json.loads(f.read())
+
+
+def compare(results, baseline, tolerance=0.1):
+	""" Cases where median time is more than tolerance (fraction) above the baseline.
+
+	Returns list of (result, baseline median_us) """
+	base = {}
+	for b in baseline:
+		base[(b['baud'], b['size'])] = b['median_us']
+	worse = []
+	for r in results:
+		b = base.get((r['baud'], r['size']))
+		if b is not None and r['median_us'] > b * (1 + tolerance):
+			worse.append((r, b))
+	return worse
+
+
+def main(argv):
+	opts = {'--bus': '2', '--sizes': ','.join(str(s) for s in SIZES), '--bauds': ','.join(str(b) for b in BAUD_RATES),
+	        '--reps': '5', '--total': '8192', '--csv': '', '--json': '', '--baseline': '', '--tolerance': '0.1'}
+	args = list(argv)
+	while args:
+		a = args.pop(0)
+		if a not in opts or not args:
+			print("Unknown option or missing value:", a)
+			return 2
+		opts[a] = args.pop(0)
+
+	results = run(int(opts['--bus']), [int(s) for s in opts['--sizes'].split(',')],
+	              [int(b) for b in opts['--bauds'].split(',')], int(opts['--reps']), int(opts['--total']))
+	if opts['--csv']:
+		save_csv(results, opts['--csv'])
+	if opts['--json']:
+		save_json(results, opts['--json'])
+	if opts['--baseline']:
+		worse = compare(results, load_json(opts['--baseline']), float(opts['--tolerance']))
+		print("\nRegressions against %s: %d" % (opts['--baseline'], len(worse)))
+		for r, b in worse:
+			print("  %7.3f Mbaud %2d bytes: median %.3f ms (baseline %.3f ms)" %
+			      (r['baud'] / 1e6, r['size'], r['median_us'] / 1e3, b / 1e3))
+		if worse:
+			return 1
+	print()
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,8 @@
 """Test speed of SPI port for different baudrates and data and show when slow"""
 
 from pyb import SPI, Pin, delay, micros, elapsed_micros, rng, disable_irq
+from Lib_spibatch import SPIBatch
+from Lib_spistream import SPIStream
 
 
 def print_elapsed_time(baud, start_time, bursts, nr_bytes):
@@ -29,6 +31,42 @@ for baud in baud_rates:
 			spi.send(bytearray([0, x, 0, a]))
 	print_elapsed_time(baud, start, 2048, 4)
 
+""" Same graphical data via SPIBatch: bursts are collected and sent as one long buffer """
+print("\nGraphical type data (2048 bursts of 4 bytes) batched by SPIBatch (1024 bytes buffer):")
+batch = SPIBatch(spi, Pin('Y5', Pin.OUT_PP), Pin('Y4', Pin.OUT_PP))   # CS (NSS for SPI 2), DC
+for baud in baud_rates:
+	spi.init(SPI.MASTER, baud)  # Change baud rate
+	start = micros()
+
+	for a in range(128):
+		for x in range(16):
+			batch.send(bytearray([0, x, 0, a]))
+	batch.flush()
+	print_elapsed_time(baud, start, 2048, 4)
+
+""" TFT command traffic: command byte + 4 data bytes (e.g. column adr 0x2A). DC changes twice per command, so
+SPIBatch still needs one transfer per DC run (1024 here), the same count as unbatched; only CS toggling is saved """
+print("\nTFT commands (512 x 0x2A + 4 data bytes), unbatched: one send for cmd, one for data:")
+cmd = bytearray([0x2A])
+for baud in baud_rates:
+	spi.init(SPI.MASTER, baud)  # Change baud rate
+	start = micros()
+
+	for a in range(512):
+		spi.send(cmd)
+		spi.send(bytearray([0, a & 0xFF, 0, 0xEF]))
+	print_elapsed_time(baud, start, 512, 5)
+
+print("\nTFT commands (512 x 0x2A + 4 data bytes) via SPIBatch.command:")
+for baud in baud_rates:
+	spi.init(SPI.MASTER, baud)  # Change baud rate
+	start = micros()
+
+	for a in range(512):
+		batch.command(0x2A, bytearray([0, a & 0xFF, 0, 0xEF]))
+	batch.flush()
+	print_elapsed_time(baud, start, 512, 5)
+
 """ Test SPI with generic data in ONE long buffer; Always(?) fast! """
 print("\nGeneric data (8192 bytes pre-prepared as ONE long buffer):")
 for baud in baud_rates:
@@ -38,6 +76,38 @@ for baud in baud_rates:
 	spi.send(data)
 	print_elapsed_time(baud, start, 1, 8192)
 
+""" Sustained throughput when each burst is prepared (computed) before sending: blocking vs double buffered """
+
+
+def prepare(buf, a):  # Graphics-like work: compute 512 bytes
+	for x in range(0, 512, 4):
+		buf[x + 1] = x >> 2
+		buf[x + 3] = a
+
+
+print("\nPrepared data (16 bursts of 512 bytes), blocking send vs SPIStream (2 x 512 bytes):")
+buf = bytearray(512)
+stream = SPIStream(spi, 2, 512)
+if not stream.running:
+	print("no _thread: blocking fallback (both loops send blocking; expect the same rate)")
+for baud in baud_rates:
+	spi.init(SPI.MASTER, baud)  # Change baud rate
+	start = micros()
+	for a in range(16):
+		prepare(buf, a)
+		spi.send(buf)
+	blocking = elapsed_micros(start)
+
+	start = micros()
+	for a in range(16):
+		prepare(stream.get_buffer(), a)
+		stream.submit(512)
+	stream.wait()
+	streamed = elapsed_micros(start)
+	print("%7.3f Mbaud  blocking:%8.0f B/s  streamed:%8.0f B/s" %
+	      (baud / 1e6, 8192e6 / blocking, 8192e6 / streamed))
+stream.close()
+
 """ Test SPI with generic data; Slow for some baudrate and data sizes """
 for nr_bytes in range(1, 17):
 	data = [0] * nr_bytes